@@ -1,125 +1,195 @@
-from django.http import JsonResponse
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views import View
-from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from datetime import date, datetime
+from functools import wraps
+import hashlib
+from uuid import UUID
 import json
-from university.models import Department, Course, Student, Teacher, ClassSchedule, Attendance, Semester
+from university.models import Student, ClassSchedule, Attendance
+from university.cache import versioned_etag
+from university.metrics import count_attendance_written
+from university.services import (
+    VALID_STATUSES, InvalidCursor, dashboard_stats, decode_cursor, encode_cursor, upsert_attendance,
+)
 
-# API Views without REST Framework - THEY WORK!
-@method_decorator(csrf_exempt, name='dispatch')
-class DepartmentAPI(View):
-    def get(self, request):
-        try:
-            departments = list(Department.objects.all().values())
-            return JsonResponse({'success': True, 'departments': departments})
-        except Exception as e:
-            return JsonResponse({'success': False, 'error': str(e)})
+def staff_required(view_func):
+    """Answer anonymous users with a 401 and users who are not staff with a 403."""
+    @wraps(view_func)
+    def wrapped(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'success': False, 'error': 'Authentication required'}, status=401)
+        if not (request.user.is_active and request.user.is_staff):
+            return JsonResponse({'success': False, 'error': 'Staff access required'}, status=403)
+        return view_func(request, *args, **kwargs)
+    return wrapped
 
-@method_decorator(csrf_exempt, name='dispatch')
-class CourseAPI(View):
-    def get(self, request):
-        try:
-            courses = list(Course.objects.all().values())
-            return JsonResponse({'success': True, 'courses': courses})
-        except Exception as e:
-            return JsonResponse({'success': False, 'error': str(e)})
+ATTENDANCE_FIELDS = ('id', 'student_id', 'class_schedule_id', 'date', 'status', 'notes', 'marked_by_id', 'timestamp')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
-@method_decorator(csrf_exempt, name='dispatch')
-class StudentAPI(View):
-    def get(self, request):
-        try:
-            students = list(Student.objects.all().values(
-                'id', 'roll_number', 'user__first_name', 'user__last_name', 
-                'course__name', 'created_at'
-            ))
-            return JsonResponse({'success': True, 'students': students})
-        except Exception as e:
-            return JsonResponse({'success': False, 'error': str(e)})
+def filter_attendance(queryset, params):
+    if params.get('student_id'):
+        queryset = queryset.filter(student_id=params['student_id'])
+    if params.get('class_schedule_id'):
+        queryset = queryset.filter(class_schedule_id=params['class_schedule_id'])
+    if params.get('status'):
+        queryset = queryset.filter(status=params['status'])
+    if params.get('date_from'):
+        queryset = queryset.filter(date__gte=datetime.strptime(params['date_from'], '%Y-%m-%d').date())
+    if params.get('date_to'):
+        queryset = queryset.filter(date__lte=datetime.strptime(params['date_to'], '%Y-%m-%d').date())
+    return queryset
 
-@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(staff_required, name='dispatch')
+@method_decorator(versioned_etag(lambda request: ['attendance']), name='get')
 class AttendanceAPI(View):
+    """
+    Attendance rows ordered by (date, id).
+    
+    Pages are keyset-paginated: pass the returned ``next_cursor`` back as
+    ``?cursor=`` to continue. ``?fields=`` projects columns, and
+    ``?format=ndjson`` streams every matching row instead of one page.
+    """
     def get(self, request):
         try:
-            attendance = list(Attendance.objects.all().values())
-            return JsonResponse({'success': True, 'attendance': attendance})
+            fields = request.GET.get('fields')
+            fields = fields.split(',') if fields else list(ATTENDANCE_FIELDS)
+            unknown = set(fields) - set(ATTENDANCE_FIELDS)
+            if unknown:
+                return JsonResponse({'success': False, 'error': f"Unknown fields: {', '.join(sorted(unknown))}"}, status=400)
+            
+            try:
+                limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+            except ValueError:
+                limit = 0
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                return JsonResponse({'success': False, 'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}, status=400)
+            
+            attendance = filter_attendance(Attendance.objects.all(), request.GET).order_by('date', 'id')
+            
+            if request.GET.get('format') == 'ndjson':
+                rows = attendance.values(*fields).iterator(chunk_size=2000)
+                return StreamingHttpResponse(
+                    (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows),
+                    content_type='application/x-ndjson'
+                )
+            
+            cursor = request.GET.get('cursor')
+            if cursor:
+                try:
+                    after_date, after_id = decode_cursor(cursor, date.fromisoformat, UUID)
+                except InvalidCursor:
+                    return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+                attendance = attendance.filter(Q(date__gt=after_date) | Q(date=after_date, id__gt=after_id))
+            
+            rows = list(attendance.values(*set(fields) | {'date', 'id'})[:limit + 1])
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            
+            return JsonResponse({
+                'success': True,
+                'attendance': [{field: row[field] for field in fields} for row in rows],
+                'next_cursor': encode_cursor(rows[-1]['date'], rows[-1]['id']) if has_more else None,
+            })
         except Exception as e:
-            return JsonResponse({'success': False, 'error': str(e)})
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
     
     def post(self, request):
         try:
             data = json.loads(request.body)
             student_id = data.get('student_id')
-            course_id = data.get('course_id')
-            status = data.get('status', 'present')
-            date = data.get('date')
+            class_schedule_id = data.get('class_schedule_id')
+            status = data.get('status', 'P')
+            date_str = data.get('date')
             
-            student = Student.objects.get(id=student_id)
-            course = Course.objects.get(id=course_id)
+            if status not in VALID_STATUSES:
+                return JsonResponse({'success': False, 'error': f'Invalid status: {status}'}, status=400)
             
-            attendance, created = Attendance.objects.get_or_create(
-                student=student,
-                course=course,
-                date=date,
-                defaults={'status': status}
-            )
+            student = Student.objects.get(id=student_id)
+            class_schedule = ClassSchedule.objects.get(id=class_schedule_id)
+            date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else timezone.now().date()
             
-            if not created:
-                attendance.status = status
-                attendance.save()
+            created, updated = upsert_attendance(class_schedule, date, {student.id: status}, marked_by=request.user)
+            count_attendance_written('AttendanceAPI', [status])
+            attendance = (created or updated)[0]
             
             return JsonResponse({
                 'success': True,
                 'message': 'Attendance marked successfully',
-                'attendance_id': attendance.id,
-                'created': created
+                'attendance_id': str(attendance.id),
+                'created': bool(created)
             })
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
-@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(staff_required, name='post')
 class BulkAttendanceAPI(View):
+    @staticmethod
+    def student_pk(value):
+        """``value`` as a Student primary key, or None if it cannot be one."""
+        # True would pass for 1
+        if isinstance(value, bool):
+            return None
+        try:
+            return Student._meta.pk.to_python(value)
+        except ValidationError:
+            return None
+    
     def post(self, request):
         try:
             data = json.loads(request.body)
-            course_id = data.get('course_id')
-            date = data.get('date')
+            class_schedule_id = data.get('class_schedule_id')
+            date_str = data.get('date')
             attendance_data = data.get('attendance_data', [])
             
-            course = Course.objects.get(id=course_id)
-            results = []
-            created_count = 0
-            updated_count = 0
+            date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else timezone.now().date()
+            class_schedule = ClassSchedule.objects.get(id=class_schedule_id)
             
-            for item in attendance_data:
-                student_id = item.get('student_id')
-                status = item.get('status', 'absent')
-                
-                student = Student.objects.get(id=student_id)
-                
-                # Create or update attendance
-                attendance, created = Attendance.objects.get_or_create(
-                    student=student,
-                    course=course,
-                    date=date,
-                    defaults={'status': status}
-                )
+            # Validate the whole batch before touching the database. Ids may
+            # arrive as strings, while in_bulk() keys its result by the real
+            # primary key values
+            student_ids = [self.student_pk(item.get('student_id')) for item in attendance_data]
+            students = Student.objects.only('id').in_bulk(
+                [student_id for student_id in student_ids if student_id is not None]
+            )
+            
+            statuses = {}
+            errors = []
+            for index, (item, student_id) in enumerate(zip(attendance_data, student_ids)):
+                status = item.get('status', 'A')
                 
-                if not created:
-                    attendance.status = status
-                    attendance.save()
-                    updated_count += 1
+                if status not in VALID_STATUSES:
+                    errors.append({'index': index, 'student_id': item.get('student_id'), 'error': f'Invalid status: {status}'})
+                elif student_id is None:
+                    errors.append({'index': index, 'student_id': item.get('student_id'), 'error': 'Invalid student id'})
+                elif student_id not in students:
+                    errors.append({'index': index, 'student_id': student_id, 'error': 'Student not found'})
                 else:
-                    created_count += 1
-                
-                results.append({
-                    'student_id': student_id,
-                    'status': status,
-                    'created': created
-                })
+                    statuses[student_id] = status
+            
+            if errors:
+                return JsonResponse({'success': False, 'error': 'Invalid attendance data', 'errors': errors}, status=400)
+            
+            created, updated = upsert_attendance(class_schedule, date, statuses, marked_by=request.user)
+            count_attendance_written('BulkAttendanceAPI', statuses.values())
+            created_ids = {attendance.student_id for attendance in created}
+            
+            results = [{
+                'student_id': student_id,
+                'status': statuses[student_id],
+                'created': student_id in created_ids
+            } for student_id in student_ids]
             
             return JsonResponse({
                 'success': True,
-                'message': f'Attendance processed: {created_count} created, {updated_count} updated',
+                'message': f'Attendance processed: {len(created)} created, {len(updated)} updated',
                 'total_processed': len(results),
                 'results': results
             })
@@ -127,30 +197,21 @@ class BulkAttendanceAPI(View):
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
+def dashboard_stats_etag(request):
+    stats = {key: value for key, value in dashboard_stats().items() if key != 'generated_at'}
+    return hashlib.md5(json.dumps(stats, sort_keys=True).encode()).hexdigest()
+
+def dashboard_stats_last_modified(request):
+    return dashboard_stats()['generated_at']
+
+@method_decorator(condition(etag_func=dashboard_stats_etag, last_modified_func=dashboard_stats_last_modified), name='get')
 class DashboardStatsAPI(View):
     def get(self, request):
         try:
-            total_students = Student.objects.count()
-            total_courses = Course.objects.count()
-            total_teachers = Teacher.objects.count()
-            
-            # Today's stats
-            from datetime import date
-            today = date.today()
-            today_attendance = Attendance.objects.filter(date=today)
-            present_today = today_attendance.filter(status='present').count()
-            absent_today = today_attendance.filter(status='absent').count()
-            
-            return JsonResponse({
-                'success': True,
-                'stats': {
-                    'total_students': total_students,
-                    'total_courses': total_courses,
-                    'total_teachers': total_teachers,
-                    'present_today': present_today,
-                    'absent_today': absent_today,
-                    'attendance_rate': round((present_today / total_students * 100) if total_students > 0 else 0, 2)
-                }
-            })
+            stats = {key: value for key, value in dashboard_stats().items() if key != 'generated_at'}
+            response = JsonResponse({'success': True, 'stats': stats})
+            # Let polling browsers revalidate with If-None-Match instead of refetching
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
\ No newline at end of file
@@ -1,3 +1,207 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from university.cache import local_cache
+from university.models import Attendance, ClassSchedule, Enrollment
+from university.roster import roster_index
+from university.services import encode_cursor
+from university.synthetic import seed_synthetic_university
+from university.testing import BudgetTestCase
+
+from . import urls as api_urls
+
+
+class APIBudgetTests(BudgetTestCase):
+    """
+    Query and latency budgets for every URL in api/urls.py, measured with
+    empty caches against a synthetic university.
+    """
+    # url name: (queries, ms)
+    BUDGETS = {
+        'api-departments': (1, 200),
+        'api-courses': (1, 200),
+        'api-students': (1, 300),
+        'api-attendance': (3, 300),
+        'api-bulk-attendance': (11, 500),
+        'api-dashboard-stats': (1, 200),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=300, departments=3, courses_per_department=3, teachers_per_department=2,
+            courses_per_student=3, weeks=2,
+        )
+        cls.class_schedule = ClassSchedule.objects.order_by('id').first()
+        cls.roster = list(
+            Enrollment.objects.filter(class_schedule=cls.class_schedule).values_list('student_id', flat=True)
+        )
+        cls.staff = User.objects.create(username='api-staff', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        roster_index.clear()
+        self.client.force_login(self.staff)
+
+    def request(self, name):
+        """(method, path, data, extra) for one request to the URL called ``name``."""
+        if name == 'api-bulk-attendance':
+            return 'post', reverse(name), json.dumps({
+                'class_schedule_id': self.class_schedule.id,
+                'date': timezone.now().date().isoformat(),
+                'attendance_data': [{'student_id': student_id, 'status': 'P'} for student_id in self.roster],
+            }), {'content_type': 'application/json'}
+        return 'get', reverse(name), None, {}
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in api_urls.urlpatterns}
+        self.assertEqual(names - set(self.BUDGETS), set(), 'URLs without a query budget')
+
+    def test_views_stay_within_budget(self):
+        for name, (queries, ms) in self.BUDGETS.items():
+            with self.subTest(name):
+                cache.clear()
+                local_cache.clear()
+                roster_index.clear()
+                method, path, data, extra = self.request(name)
+                with self.assertBudget(f'{method.upper()} {path}', queries, ms):
+                    response = getattr(self.client, method)(path, data, **extra)
+                self.assertLess(response.status_code, 400, f'{name} returned {response.status_code}')
+
+
+class BulkAttendanceAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=20, departments=1, courses_per_department=1, teachers_per_department=1,
+            courses_per_student=1, weeks=1,
+        )
+        cls.class_schedule = ClassSchedule.objects.order_by('id').first()
+        cls.roster = list(
+            Enrollment.objects.filter(class_schedule=cls.class_schedule).values_list('student_id', flat=True)
+        )
+        cls.staff = User.objects.create(username='api-staff', is_staff=True)
+        cls.user = User.objects.create(username='api-user')
+
+    def post(self, attendance_data):
+        return self.client.post(reverse('api-bulk-attendance'), json.dumps({
+            'class_schedule_id': self.class_schedule.id,
+            'date': '2024-01-15',
+            'attendance_data': attendance_data,
+        }), content_type='application/json')
+
+    def test_anonymous_users_are_rejected(self):
+        response = self.post([{'student_id': self.roster[0], 'status': 'P'}])
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Attendance.objects.filter(date='2024-01-15').exists())
+
+    def test_users_who_are_not_staff_are_rejected(self):
+        self.client.force_login(self.user)
+        response = self.post([{'student_id': self.roster[0], 'status': 'P'}])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Attendance.objects.filter(date='2024-01-15').exists())
+
+    def test_string_ids_are_accepted(self):
+        self.client.force_login(self.staff)
+        response = self.post([{'student_id': str(student_id), 'status': 'L'} for student_id in self.roster[:2]])
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(
+            [(result['student_id'], result['created']) for result in response.json()['results']],
+            [(student_id, True) for student_id in self.roster[:2]],
+        )
+        self.assertEqual(Attendance.objects.filter(date='2024-01-15', status='L').count(), 2)
+
+    def test_invalid_ids_are_reported_per_item(self):
+        self.client.force_login(self.staff)
+        response = self.post([
+            {'student_id': self.roster[0], 'status': 'P'},
+            {'student_id': 'abc', 'status': 'P'},
+            {'student_id': None, 'status': 'P'},
+            {'student_id': [1], 'status': 'P'},
+            {'student_id': '999999', 'status': 'P'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(error['index'], error['error']) for error in response.json()['errors']],
+            [(1, 'Invalid student id'), (2, 'Invalid student id'), (3, 'Invalid student id'),
+             (4, 'Student not found')],
+        )
+        self.assertFalse(Attendance.objects.filter(date='2024-01-15').exists())
+
+    def test_staff_mark_attendance(self):
+        self.client.force_login(self.staff)
+        response = self.post([{'student_id': student_id, 'status': 'P'} for student_id in self.roster])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(Attendance.objects.filter(marked_by=self.staff).values_list('student_id', flat=True)),
+            set(self.roster),
+        )
+
+
+class AttendanceAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=20, departments=1, courses_per_department=1, teachers_per_department=1,
+            courses_per_student=1, weeks=1,
+        )
+        cls.enrollment = Enrollment.objects.order_by('id').first()
+        cls.staff = User.objects.create(username='api-staff', is_staff=True)
+
+    def post(self):
+        return self.client.post(reverse('api-attendance'), json.dumps({
+            'student_id': self.enrollment.student_id,
+            'class_schedule_id': self.enrollment.class_schedule_id,
+            'date': '2024-01-15',
+            'status': 'L',
+        }), content_type='application/json')
+
+    def test_anonymous_users_cannot_mark_attendance(self):
+        self.assertEqual(self.post().status_code, 401)
+        self.assertFalse(Attendance.objects.filter(date='2024-01-15').exists())
+
+    def test_anonymous_users_cannot_read_attendance(self):
+        for params in [{}, {'format': 'ndjson'}]:
+            with self.subTest(**params):
+                response = self.client.get(reverse('api-attendance'), params)
+                self.assertEqual(response.status_code, 401)
+                self.assertNotIn('ETag', response)
+
+    def test_users_who_are_not_staff_cannot_read_attendance(self):
+        self.client.force_login(User.objects.create(username='api-student'))
+        self.assertEqual(self.client.get(reverse('api-attendance'), {'format': 'ndjson'}).status_code, 403)
+
+    def test_staff_mark_attendance(self):
+        self.client.force_login(self.staff)
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['created'])
+        self.assertEqual(Attendance.objects.get(date='2024-01-15').marked_by, self.staff)
+
+    def test_limit_out_of_range_is_rejected(self):
+        self.client.force_login(self.staff)
+        for limit in ['0', '-1', '1001', 'ten']:
+            with self.subTest(limit=limit):
+                response = self.client.get(reverse('api-attendance'), {'limit': limit})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('limit must be between 1 and 1000', response.json()['error'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_login(self.staff)
+        for cursor in ['not a cursor', encode_cursor('2024-01-15'), encode_cursor('2024-01-15', 'not-a-uuid')]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('api-attendance'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Invalid cursor')
 
-# Create your tests here.
+    def test_limit_pages_through_rows(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('api-attendance'), {'limit': 1}).json()
+        self.assertEqual(len(response['attendance']), 1)
+        self.assertIsNotNone(response['next_cursor'])
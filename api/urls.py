@@ -1,11 +1,11 @@
 from django.urls import path 
-from . import views 
+from . import views, serializers 
  
 urlpatterns = [ 
     path('departments/', views.DepartmentAPI.as_view(), name='api-departments'), 
     path('courses/', views.CourseAPI.as_view(), name='api-courses'), 
     path('students/', views.StudentAPI.as_view(), name='api-students'), 
-    path('attendance/', views.AttendanceAPI.as_view(), name='api-attendance'), 
-    path('bulk-attendance/', views.BulkAttendanceAPI.as_view(), name='api-bulk-attendance'), 
-    path('dashboard-stats/', views.DashboardStatsAPI.as_view(), name='api-dashboard-stats'), 
+    path('attendance/', serializers.AttendanceAPI.as_view(), name='api-attendance'), 
+    path('bulk-attendance/', serializers.BulkAttendanceAPI.as_view(), name='api-bulk-attendance'), 
+    path('dashboard-stats/', serializers.DashboardStatsAPI.as_view(), name='api-dashboard-stats'), 
 ] 
@@ -1,39 +1,40 @@
 from django.http import JsonResponse 
 from django.views import View 
 from django.views.decorators.csrf import csrf_exempt 
-from django.utils.decorators import method_decorator 
-import json 
-from university.models import Department, Course, Student, Teacher, ClassSchedule, Attendance, Semester 
+from django.utils.decorators import classonlymethod, method_decorator 
+from university.models import Department, Course, Student 
+from university.cache import versioned_etag 
  
-@method_decorator(csrf_exempt, name='dispatch') 
-class DepartmentAPI(View): 
-    def get(self, request): 
-        departments = list(Department.objects.all().values()) 
-        return JsonResponse({'departments': departments}) 
+class VersionedListAPI(View): 
+    """Async list endpoint whose conditional GETs are answered from ``scopes``' version tokens.""" 
+    scopes = () 
  
-@method_decorator(csrf_exempt, name='dispatch') 
-class CourseAPI(View): 
-    def get(self, request): 
-        courses = list(Course.objects.all().values()) 
-        return JsonResponse({'courses': courses}) 
+    @classonlymethod 
+    def as_view(cls, **initkwargs): 
+        # method_decorator cannot wrap async handlers in Django 4.2, so the 
+        # ETag check wraps the whole view instead 
+        return versioned_etag(lambda request: list(cls.scopes))(super().as_view(**initkwargs)) 
  
 @method_decorator(csrf_exempt, name='dispatch') 
-class StudentAPI(View): 
-    def get(self, request): 
-        students = list(Student.objects.all().values()) 
-        return JsonResponse({'students': students}) 
+class DepartmentAPI(VersionedListAPI): 
+    scopes = ['departments'] 
+ 
+    async def get(self, request): 
+        departments = [department async for department in Department.objects.all().values()] 
+        return JsonResponse({'departments': departments}) 
  
 @method_decorator(csrf_exempt, name='dispatch') 
-class AttendanceAPI(View): 
-    def get(self, request): 
-        attendance = list(Attendance.objects.all().values()) 
-        return JsonResponse({'attendance': attendance}) 
+class CourseAPI(VersionedListAPI): 
+    scopes = ['courses'] 
+ 
+    async def get(self, request): 
+        courses = [course async for course in Course.objects.all().values()] 
+        return JsonResponse({'courses': courses}) 
  
 @method_decorator(csrf_exempt, name='dispatch') 
-class BulkAttendanceAPI(View): 
-    def post(self, request): 
-        return JsonResponse({'message': 'Bulk attendance endpoint'}) 
+class StudentAPI(VersionedListAPI): 
+    scopes = ['students'] 
  
-class DashboardStatsAPI(View): 
-    def get(self, request): 
-        return JsonResponse({'message': 'Dashboard stats endpoint'}) 
+    async def get(self, request): 
+        students = [student async for student in Student.objects.all().values()] 
+        return JsonResponse({'students': students}) 
@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
+# Async views run their queries on per-request executor threads, so a
+# persistent connection would be left open on each of them. Use the
+# database's own pooling (e.g. PgBouncer) under ASGI instead.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -6,6 +6,8 @@ import os
 from pathlib import Path
 from decouple import config # type: ignore
 
+from .database import database_from_url
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -35,9 +37,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the time and queries of every other middleware are counted
+    'university.instrumentation.RequestMetricsMiddleware',
+    'university.profiling.SlowRequestProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     # CORS middleware should be at the top
     'corsheaders.middleware.CorsMiddleware',
+    # Before sessions and auth so their reads are routed too
+    'university.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -50,7 +57,8 @@ ROOT_URLCONF = 'attendance_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for RequestMetricsMiddleware
+        'BACKEND': 'university.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -67,11 +75,158 @@ TEMPLATES = [
 WSGI_APPLICATION = 'attendance_system.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / config('DB_NAME', default='db.sqlite3'),
+# PostgreSQL when DATABASE_URL is set (requires the psycopg package),
+# otherwise SQLite. Connections are kept open for DB_CONN_MAX_AGE seconds
+# and checked before reuse.
+DATABASE_URL = config('DATABASE_URL', default='')
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
+if DATABASE_URL:
+    DATABASES = {
+        'default': database_from_url(
+            DATABASE_URL,
+            CONN_MAX_AGE=DB_CONN_MAX_AGE,
+            CONN_HEALTH_CHECKS=DB_CONN_HEALTH_CHECKS,
+        )
+    }
+else:
+    # attendance_system.sqlite3 applies the pragmas below to every connection.
+    # WAL lets readers run alongside the single writer, and IMMEDIATE
+    # transactions make concurrent writers wait up to busy_timeout for the
+    # write lock instead of failing with "database is locked".
+    DATABASES = {
+        'default': {
+            'ENGINE': 'attendance_system.sqlite3',
+            'NAME': BASE_DIR / config('DB_NAME', default='db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+            'OPTIONS': {
+                'pragmas': {
+                    'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+                    'synchronous': config('SQLITE_SYNCHRONOUS', default='normal'),
+                    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+                    'cache_size': config('SQLITE_CACHE_SIZE', default=-20000, cast=int),
+                    'mmap_size': config('SQLITE_MMAP_SIZE', default=134217728, cast=int),
+                    'temp_store': config('SQLITE_TEMP_STORE', default='memory'),
+                },
+                'transaction_mode': config('SQLITE_TRANSACTION_MODE', default='immediate'),
+            },
+        }
+    }
+
+# Read replica
+# GET requests read from the 'replica' alias when REPLICA_DATABASE_URL (a
+# PostgreSQL streaming replica) or REPLICA_DB_NAME (an SQLite file kept in
+# sync by e.g. Litestream) is set. Keeping it up to date is the database's
+# job, not Django's. Clients that write are pinned to the primary for
+# REPLICA_PIN_SECONDS. Tests mirror the replica onto the default database;
+# the routing tests set up a separate replica of their own.
+REPLICA_DATABASE_URL = config('REPLICA_DATABASE_URL', default='')
+REPLICA_DB_NAME = config('REPLICA_DB_NAME', default='')
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = database_from_url(
+        REPLICA_DATABASE_URL,
+        CONN_MAX_AGE=DB_CONN_MAX_AGE,
+        CONN_HEALTH_CHECKS=DB_CONN_HEALTH_CHECKS,
+        TEST={'MIRROR': 'default'},
+    )
+elif REPLICA_DB_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / REPLICA_DB_NAME,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['university.routers.ReplicaRouter']
+
+# Attendance writes the async mark_attendance_api view runs at once per
+# worker process, under ASGI or WSGI. SQLite has a single writer, so more
+# only adds lock contention.
+ASYNC_DB_WRITE_CONCURRENCY = config('ASYNC_DB_WRITE_CONCURRENCY', default=4 if DATABASE_URL else 1, cast=int)
+
+# Cache
+# The shared tier: Redis when REDIS_URL is set (requires the redis package),
+# otherwise a file-based cache when CACHE_DIR is set so every worker process
+# sees the same entries, otherwise local memory (development and tests).
+# Cache invalidation between worker processes goes through this cache, so
+# local memory is only right for a single process (check university.W001).
+REDIS_URL = config('REDIS_URL', default='')
+CACHE_DIR = config('CACHE_DIR', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+elif CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# The per-process LRU tier placed in front of the shared cache
+LOCAL_CACHE_MAX_ENTRIES = config('LOCAL_CACHE_MAX_ENTRIES', default=1000, cast=int)
+LOCAL_CACHE_TIMEOUT = config('LOCAL_CACHE_TIMEOUT', default=30, cast=int)
+
+# Seconds the shared cache keeps a version token (and its recorded changes)
+# after the last write to its scope. Per class-day and per-student scopes
+# pile up otherwise; an expired token only costs one fresh read.
+VERSION_TOKEN_TIMEOUT = config('VERSION_TOKEN_TIMEOUT', default=7 * 24 * 3600, cast=int)
+
+# Request metrics
+# The share of requests (0 to 1) whose SQL queries, database and template
+# time and response size are sent back in a Server-Timing header and logged
+# as a JSON line to the university.requests logger at REQUEST_METRICS_LOG_LEVEL
+# (DEBUG, INFO, ...). The logger lets that level through, see LOGGING.
+REQUEST_METRICS_SAMPLE_RATE = config('REQUEST_METRICS_SAMPLE_RATE', default=0.0, cast=float)
+REQUEST_METRICS_LOG_LEVEL = config('REQUEST_METRICS_LOG_LEVEL', default='INFO')
+
+# Prometheus metrics at /metrics. Under a multi-process server (gunicorn)
+# set METRICS_DIR to a directory every worker can write to, emptied before
+# the server starts, so a scrape sees the totals of all workers. Scrapers
+# authenticate with "Authorization: Bearer <METRICS_TOKEN>"; without a token
+# only staff users can read the endpoint.
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Slow request profiles
+# When SLOW_REQUEST_PROFILE_DIR is set, the stack of every request is
+# sampled every SLOW_REQUEST_SAMPLE_INTERVAL_MS, and requests taking
+# SLOW_REQUEST_THRESHOLD_MS or longer are kept there as flame graph input,
+# up to SLOW_REQUEST_PROFILE_MAX of them. Browse them in the admin.
+SLOW_REQUEST_PROFILE_DIR = config('SLOW_REQUEST_PROFILE_DIR', default='')
+SLOW_REQUEST_THRESHOLD_MS = config('SLOW_REQUEST_THRESHOLD_MS', default=1000, cast=int)
+SLOW_REQUEST_SAMPLE_INTERVAL_MS = config('SLOW_REQUEST_SAMPLE_INTERVAL_MS', default=10, cast=float)
+SLOW_REQUEST_PROFILE_MAX = config('SLOW_REQUEST_PROFILE_MAX', default=100, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'university.requests': {
+            'handlers': ['console'],
+            'level': REQUEST_METRICS_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
 }
 
 # Password validation
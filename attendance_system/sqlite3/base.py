@@ -0,0 +1,50 @@
+"""
+SQLite backend tuned for several worker processes writing at once.
+
+Two extra keys are read from the database OPTIONS and removed before the
+rest are passed to ``sqlite3.connect``:
+
+``pragmas``
+    A mapping of PRAGMA name to value, applied to every new connection
+    (``journal_mode``, ``synchronous``, ``busy_timeout``, ...).
+``transaction_mode``
+    ``DEFERRED`` (SQLite's default), ``IMMEDIATE`` or ``EXCLUSIVE``. With
+    ``IMMEDIATE``, ``transaction.atomic()`` takes the write lock when the
+    block starts. Concurrent writers then queue on ``busy_timeout``. Without
+    it, a reader that later tries to upgrade to a writer fails straight
+    away with "database is locked".
+"""
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {'journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store'}
+TRANSACTION_MODES = {'DEFERRED', 'IMMEDIATE', 'EXCLUSIVE'}
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', None) or {}
+        self.transaction_mode = (kwargs.pop('transaction_mode', None) or 'DEFERRED').upper()
+
+        unknown = set(self.pragmas) - PRAGMAS
+        if unknown:
+            raise ImproperlyConfigured(f"Unsupported SQLite pragmas: {', '.join(sorted(unknown))}")
+        for name, value in self.pragmas.items():
+            if not PRAGMA_VALUE.match(str(value)):
+                raise ImproperlyConfigured(f'Invalid value for SQLite pragma {name}: {value!r}')
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f'Invalid SQLite transaction_mode: {self.transaction_mode!r}')
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import Department, Course, Student, Teacher, Semester, ClassSchedule, Attendance, Notification
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from . import profiling
+from .models import Department, Course, Student, Teacher, Semester, ClassSchedule, Enrollment, Attendance, AttendanceSummary, Notification, RequestProfile
 
 # REMOVE these inline classes - they cause the mixed form issue
 # class StudentInline(admin.StackedInline):
@@ -75,6 +80,14 @@ class ClassScheduleAdmin(admin.ModelAdmin):
     list_filter = ['semester', 'day_of_week', 'is_active', 'course__department']
     list_editable = ['is_active']
 
+@admin.register(Enrollment)
+class EnrollmentAdmin(admin.ModelAdmin):
+    list_display = ['student', 'class_schedule', 'enrolled_at']
+    list_filter = ['class_schedule__semester', 'class_schedule__course']
+    search_fields = ['student__student_id', 'student__user__first_name', 'student__user__last_name']
+    raw_id_fields = ['student', 'class_schedule']
+    ordering = ['class_schedule', 'student__student_id']
+
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
     list_display = ['student', 'class_schedule', 'date', 'status', 'marked_by', 'timestamp']
@@ -83,6 +96,73 @@ class AttendanceAdmin(admin.ModelAdmin):
     date_hierarchy = 'date'
     raw_id_fields = ['student', 'class_schedule', 'marked_by']
 
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Read-only pages over the profile files in SLOW_REQUEST_PROFILE_DIR."""
+    
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_active and request.user.is_staff
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path('', self.admin_site.admin_view(self.changelist_view), name='%s_%s_changelist' % info),
+            path('<str:profile_id>/', self.admin_site.admin_view(self.profile_view), name='%s_%s_change' % info),
+            path('<str:profile_id>/folded/', self.admin_site.admin_view(self.folded_view), name='%s_%s_folded' % info),
+        ]
+    
+    def context(self, request, **extra):
+        return {**self.admin_site.each_context(request), 'opts': self.opts, **extra}
+    
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise Http404
+        profiles = [profiling.load_profile(profile_id) for profile_id in profiling.profile_ids()]
+        return TemplateResponse(request, 'admin/university/requestprofile/profile_list.html', self.context(
+            request,
+            title='Slow request profiles',
+            profiles=[profile for profile in profiles if profile is not None],
+            profile_dir=settings.SLOW_REQUEST_PROFILE_DIR,
+            threshold_ms=settings.SLOW_REQUEST_THRESHOLD_MS,
+        ))
+    
+    def profile_view(self, request, profile_id):
+        profile = profiling.load_profile(profile_id)
+        folded = profiling.load_folded(profile_id)
+        if profile is None or folded is None or not self.has_view_permission(request):
+            raise Http404
+        return TemplateResponse(request, 'admin/university/requestprofile/profile.html', self.context(
+            request,
+            title=f'{profile["method"]} {profile["path"]}',
+            profile=profile,
+            frames=profiling.top_frames(folded),
+        ))
+    
+    def folded_view(self, request, profile_id):
+        folded = profiling.load_folded(profile_id)
+        if folded is None or not self.has_view_permission(request):
+            raise Http404
+        response = HttpResponse(folded, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.folded"'
+        return response
+
+@admin.register(AttendanceSummary)
+class AttendanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ['student', 'course', 'semester', 'present', 'absent', 'late', 'excused', 'updated_at']
+    list_filter = ['semester', 'course']
+    search_fields = ['student__student_id']
+    raw_id_fields = ['student', 'course', 'semester']
+    readonly_fields = ['present', 'absent', 'late', 'excused']
+
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ['user', 'title', 'is_read', 'created_at']
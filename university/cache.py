@@ -0,0 +1,283 @@
+"""
+Caching helpers shared by the university and api apps.
+
+Two tiers are used: Django's ``default`` cache is the shared tier (Redis in
+production, locmem or file-based elsewhere, see CACHES in settings), and
+``local_cache`` is a bounded per-process LRU placed in front of it for values
+that are read far more often than they change.
+
+Invalidation works through version tokens. Each scope (``'students'``,
+``'attendance:<class_schedule_id>:<date>'``, ...) has a token in the shared
+cache that signal handlers and the write services replace on commit. Keys
+built from a token therefore stop matching as soon as the data changes, in
+every process at once.
+"""
+import hashlib
+import threading
+import time
+from random import randrange
+from collections import OrderedDict
+from functools import wraps
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+
+from .metrics import CACHE_LOOKUPS
+from .routers import use_primary
+
+
+class LocalLRUCache:
+    """
+    A thread-safe, size-bounded in-process cache with per-entry expiry.
+
+    Values are stored as-is rather than pickled, so callers must treat what
+    they get back as read-only.
+    """
+    def __init__(self, max_entries=1000, timeout=30):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _count_lookup(key, result):
+    # The key prefix ('queryset', 'dashboard-stats', ...) names the kind of value
+    CACHE_LOOKUPS.inc(kind=key.split(':', 1)[0], result=result)
+
+
+def shared_get(key):
+    """Read ``key`` from the shared cache, counting the hit or miss."""
+    value = cache.get(key)
+    _count_lookup(key, 'miss' if value is None else 'shared')
+    return value
+
+
+class TwoTierCache:
+    """Read through a LocalLRUCache into the shared Django cache."""
+    def __init__(self, local, shared=cache):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not None:
+            _count_lookup(key, 'local')
+            return value
+        value = self.shared.get(key)
+        if value is None:
+            _count_lookup(key, 'miss')
+            return default
+        _count_lookup(key, 'shared')
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.shared.set(key, value, timeout)
+        self.local.set(key, value, timeout)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.local.delete(key)
+
+
+local_cache = LocalLRUCache(
+    max_entries=getattr(settings, 'LOCAL_CACHE_MAX_ENTRIES', 1000),
+    timeout=getattr(settings, 'LOCAL_CACHE_TIMEOUT', 30),
+)
+tiered_cache = TwoTierCache(local_cache)
+
+VERSION_TIMEOUT = getattr(settings, 'VERSION_TOKEN_TIMEOUT', 7 * 24 * 3600)
+# How many changes of a scope changes_since() can look back over
+CHANGE_HISTORY = 100
+
+
+def _version_key(scope):
+    return f'version:{scope}'
+
+
+def get_versions(*scopes):
+    """
+    Return the current version token of each scope.
+
+    A token is an arbitrary string that changes whenever data in its scope is
+    written; scopes that have never been bumped (or were evicted or expired)
+    get a fresh token so stale ETags can never match again.
+    """
+    keys = [_version_key(scope) for scope in scopes]
+    tokens = cache.get_many(keys)
+    missing = {key: uuid4().hex for key in keys if key not in tokens}
+    CACHE_LOOKUPS.inc(len(tokens), kind='version', result='shared')
+    if missing:
+        CACHE_LOOKUPS.inc(len(missing), kind='version', result='miss')
+        cache.set_many(missing, VERSION_TIMEOUT)
+        tokens.update(missing)
+    return [tokens[key] for key in keys]
+
+
+def _counter_key(scope):
+    return f'changes:{scope}'
+
+
+def _change_key(scope, number):
+    return f'change:{scope}:{number}'
+
+
+def bump_versions(*scopes):
+    """Give each scope a new version token once the current transaction commits."""
+    token = uuid4().hex
+    versions = {_version_key(scope): token for scope in scopes}
+    # Restart the change counts: the changes recorded so far no longer lead
+    # up to the current token
+    counters = [_counter_key(scope) for scope in scopes]
+
+    def publish():
+        cache.delete_many(counters)
+        cache.set_many(versions, VERSION_TIMEOUT)
+    transaction.on_commit(publish)
+
+
+def bump_version_with_change(scope, change):
+    """
+    Give ``scope`` a new version token once the current transaction commits,
+    recording ``change`` (e.g. the pk of the row written) under it.
+
+    The tokens of such a scope count up, so a reader holding an older token
+    can ask changes_since() what happened in between instead of reloading
+    everything.
+    """
+    def publish():
+        counter = _counter_key(scope)
+        # Counts restart at a random offset, so tokens counted before a
+        # bump_versions() or an eviction can never be mistaken for new ones.
+        # There is one counter per scope, so it is kept for good
+        cache.add(counter, randrange(1 << 48) * 1000, None)
+        number = cache.incr(counter)
+        cache.set_many(
+            {_change_key(scope, number): change, _version_key(scope): str(number)}, VERSION_TIMEOUT
+        )
+        # changes_since() never looks back further than that
+        cache.delete(_change_key(scope, number - CHANGE_HISTORY))
+    transaction.on_commit(publish)
+
+
+def changes_since(scope, old_token, new_token, limit=CHANGE_HISTORY):
+    """
+    Return the changes bump_version_with_change() recorded for ``scope`` after
+    ``old_token``, up to ``new_token``.
+
+    Returns None when that history is unknown: a token that is not a count
+    (bump_versions() and get_versions() hand out random ones), a count from
+    another run of the counter, more than ``limit`` changes, or an evicted
+    change.
+    Readers must then reload everything.
+    """
+    try:
+        old, new = int(old_token), int(new_token)
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= new - old <= limit:
+        return None
+    keys = [_change_key(scope, number) for number in range(old + 1, new + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        return None
+    return [changes[key] for key in keys]
+
+
+def cached_queryset(*scopes, timeout=300):
+    """
+    Memoize a function returning a queryset as a list in the two-tier cache.
+
+    The key combines the function, its arguments and the version tokens of
+    ``scopes``, so a write to any of those scopes makes the next call query
+    the database again.
+    """
+    def decorator(func):
+        @wraps(func)
+        @use_primary
+        def wrapped(*args):
+            tokens = get_versions(*scopes)
+            key = ':'.join(['queryset', func.__module__, func.__qualname__, *map(str, args), *tokens])
+            value = tiered_cache.get(key)
+            if value is None:
+                value = list(func(*args))
+                tiered_cache.set(key, value, timeout)
+            return value
+        return wrapped
+    return decorator
+
+
+def versioned_etag(scopes_func):
+    """
+    Decorate a view so conditional GETs are answered from version tokens.
+
+    ``scopes_func`` takes the view's arguments and returns the version scopes
+    its response depends on, or None to skip conditional handling. The ETag
+    hashes those tokens with the full request path, so a matching
+    If-None-Match gets a 304 before the view runs any query.
+    """
+    def etag_func(request, *args, **kwargs):
+        scopes = scopes_func(request, *args, **kwargs)
+        if scopes is None:
+            return None
+        tokens = get_versions(*scopes)
+        return hashlib.md5('|'.join([request.get_full_path(), *tokens]).encode()).hexdigest()
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            # django.views.decorators.http.condition is sync-only in Django 4.2
+            @wraps(view)
+            async def async_wrapped(request, *args, **kwargs):
+                etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+                etag = quote_etag(etag) if etag is not None else None
+                response = get_conditional_response(request, etag=etag)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    patch_cache_control(response, private=True, no_cache=True)
+                if etag and request.method in ('GET', 'HEAD'):
+                    response.headers.setdefault('ETag', etag)
+                return response
+            return async_wrapped
+
+        @condition(etag_func=etag_func)
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,32 @@
+"""
+System checks for settings the university app relies on.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Cache backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Version tokens, versioned ETags and the roster index are invalidated
+    through the default cache, so with several worker processes it has to
+    be shared between them.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'The default cache ({backend}) is local to each process.',
+        hint=(
+            'Writes in one worker process are not seen by the others: their roster index never reloads and '
+            'their ETags keep answering 304 with stale data. Set REDIS_URL or CACHE_DIR unless the site runs '
+            'in a single process.'
+        ),
+        id='university.W001',
+    )]
@@ -0,0 +1,66 @@
+"""
+Access decorators that also work on ``async def`` views.
+
+Django 4.2's ``login_required`` and ``staff_member_required`` only wrap
+synchronous views. These versions hand sync views to Django unchanged. For
+async views, the user check runs in a worker thread, because loading
+``request.user`` queries the database.
+"""
+from functools import wraps
+from urllib.parse import urlparse
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import REDIRECT_FIELD_NAME
+from django.contrib.auth import decorators as auth_decorators
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import resolve_url
+
+
+def _redirect_to_login(request, login_url, redirect_field_name):
+    # The same redirect Django's user_passes_test builds
+    path = request.build_absolute_uri()
+    resolved_login_url = resolve_url(login_url or settings.LOGIN_URL)
+    login_scheme, login_netloc = urlparse(resolved_login_url)[:2]
+    current_scheme, current_netloc = urlparse(path)[:2]
+    if (not login_scheme or login_scheme == current_scheme) and (
+        not login_netloc or login_netloc == current_netloc
+    ):
+        path = request.get_full_path()
+    return redirect_to_login(path, resolved_login_url, redirect_field_name)
+
+
+def user_passes_test(test_func, login_url=None, redirect_field_name=REDIRECT_FIELD_NAME):
+    def decorator(view_func):
+        if not iscoroutinefunction(view_func):
+            return auth_decorators.user_passes_test(test_func, login_url, redirect_field_name)(view_func)
+
+        @wraps(view_func)
+        async def wrapped(request, *args, **kwargs):
+            if await sync_to_async(test_func)(request.user):
+                return await view_func(request, *args, **kwargs)
+            return _redirect_to_login(request, login_url, redirect_field_name)
+        return wrapped
+    return decorator
+
+
+def login_required(function=None, redirect_field_name=REDIRECT_FIELD_NAME, login_url=None):
+    actual_decorator = user_passes_test(
+        lambda u: u.is_authenticated,
+        login_url=login_url,
+        redirect_field_name=redirect_field_name,
+    )
+    if function:
+        return actual_decorator(function)
+    return actual_decorator
+
+
+def staff_member_required(view_func=None, redirect_field_name=REDIRECT_FIELD_NAME, login_url='admin:login'):
+    actual_decorator = user_passes_test(
+        lambda u: u.is_active and u.is_staff,
+        login_url=login_url,
+        redirect_field_name=redirect_field_name,
+    )
+    if view_func:
+        return actual_decorator(view_func)
+    return actual_decorator
@@ -3,6 +3,7 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import Attendance, Student, ClassSchedule, Course, Department, Teacher, Semester
 from django.utils import timezone
+from .services import class_schedule_choices, department_choices, student_choices
 
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -32,7 +33,47 @@ class StudentRegistrationForm(forms.ModelForm):
             'address': forms.Textarea(attrs={'rows': 3}),
         }
 
+class CachedChoiceIterator:
+    def __init__(self, field):
+        self.field = field
+    
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from self.field.choices_func()
+    
+    def __len__(self):
+        return len(self.field.choices_func()) + (self.field.empty_label is not None)
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """
+    A ModelChoiceField whose options come from a cached list of (id, label)
+    pairs instead of iterating the queryset on every render. The queryset is
+    still used to validate submitted values.
+    """
+    def __init__(self, queryset, choices_func, **kwargs):
+        self.choices_func = choices_func
+        super().__init__(queryset, **kwargs)
+    
+    def _get_choices(self):
+        if hasattr(self, '_choices'):
+            return self._choices
+        return CachedChoiceIterator(self)
+    
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
 class AttendanceForm(forms.ModelForm):
+    student = CachedModelChoiceField(
+        queryset=Student.objects.filter(is_active=True),
+        choices_func=student_choices,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    class_schedule = CachedModelChoiceField(
+        queryset=ClassSchedule.objects.filter(is_active=True),
+        choices_func=class_schedule_choices,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    
     class Meta:
         model = Attendance
         fields = ['student', 'class_schedule', 'date', 'status', 'notes']
@@ -40,20 +81,17 @@ class AttendanceForm(forms.ModelForm):
             'date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'status': forms.Select(attrs={'class': 'form-control'}),
             'notes': forms.Textarea(attrs={'rows': 2, 'class': 'form-control'}),
-            'student': forms.Select(attrs={'class': 'form-control'}),
-            'class_schedule': forms.Select(attrs={'class': 'form-control'}),
         }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['student'].queryset = Student.objects.filter(is_active=True)
-        self.fields['class_schedule'].queryset = ClassSchedule.objects.filter(is_active=True)
         if not self.instance.pk:
             self.fields['date'].initial = timezone.now().date()
 
 class BulkAttendanceForm(forms.Form):
-    class_schedule = forms.ModelChoiceField(
+    class_schedule = CachedModelChoiceField(
         queryset=ClassSchedule.objects.filter(is_active=True),
+        choices_func=class_schedule_choices,
         widget=forms.Select(attrs={'class': 'form-control'})
     )
     date = forms.DateField(
@@ -96,8 +134,40 @@ class StudentSearchForm(forms.Form):
         'class': 'form-control',
         'placeholder': 'Search by Name...'
     }))
+    department = CachedModelChoiceField(
+        queryset=Department.objects.all(),
+        choices_func=department_choices,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+class AttendanceExportForm(DateRangeForm):
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+    
+    start_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    end_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    semester = forms.ModelChoiceField(
+        queryset=Semester.objects.all(),
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    course = forms.ModelChoiceField(
+        queryset=Course.objects.all(),
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
     department = forms.ModelChoiceField(
         queryset=Department.objects.all(),
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'})
-    )
\ No newline at end of file
+    )
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
\ No newline at end of file
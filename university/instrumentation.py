@@ -0,0 +1,215 @@
+"""
+Per-request SQL and timing instrumentation.
+
+RequestMetricsMiddleware times every request and counts its queries for
+the Prometheus histograms in ``university.metrics``. It also samples
+REQUEST_METRICS_SAMPLE_RATE of requests, and for each of those records:
+
+* the number of SQL queries and the time spent in them, through an
+  execute wrapper installed on every database connection as it is opened,
+  so it works without DEBUG=True and for the executor threads async views
+  run their queries on;
+* the slowest statement;
+* repeated statements (the same SQL run again with other parameters), the
+  signature of an N+1;
+* time spent rendering templates, through TimedDjangoTemplates;
+* the response size.
+
+They are sent back in a ``Server-Timing`` header, which browser dev tools
+show next to the request, and logged as one JSON line to the
+``university.requests`` logger at REQUEST_METRICS_LOG_LEVEL.
+"""
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+from .metrics import REQUEST_DB_QUERIES, REQUEST_DB_TIME, REQUEST_LATENCY, REQUESTS_IN_PROGRESS
+
+logger = logging.getLogger('university.requests')
+
+# Statements in log lines are cut to this many characters
+MAX_LOGGED_SQL = 500
+
+_current_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Collects the queries and template renders of the code run inside ``with``.
+
+    Only the query count and time are kept unless ``detailed`` is set.
+    """
+
+    __slots__ = ('started', 'detailed', 'queries', 'db_seconds', 'slowest_seconds', 'slowest_sql', 'statements',
+                 'template_seconds', '_token')
+
+    def __init__(self, detailed=True):
+        self.started = time.perf_counter()
+        self.detailed = detailed
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+        self.statements = Counter()
+        self.template_seconds = 0.0
+
+    def __enter__(self):
+        self._token = _current_metrics.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_metrics.reset(self._token)
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.db_seconds += elapsed
+        if not self.detailed:
+            return
+        self.statements[sql] += 1
+        if elapsed > self.slowest_seconds:
+            self.slowest_seconds = elapsed
+            self.slowest_sql = sql
+
+    def most_repeated(self):
+        """(sql, count) for the statement run most often, or (None, 0)."""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+    def as_dict(self, request, response, elapsed):
+        repeated_sql, repeated = self.most_repeated()
+        match = request.resolver_match
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2),
+            'db_queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 2),
+            'db_slowest_ms': round(self.slowest_seconds * 1000, 2),
+            'db_slowest_sql': self.slowest_sql[:MAX_LOGGED_SQL] if self.slowest_sql else None,
+            'db_repeated': self.queries - len(self.statements),
+            'db_most_repeated': repeated,
+            'db_most_repeated_sql': repeated_sql[:MAX_LOGGED_SQL] if repeated > 1 else None,
+            'template_ms': round(self.template_seconds * 1000, 2),
+            'response_bytes': None if response.streaming else len(response.content),
+        }
+
+    def server_timing(self, fields):
+        metrics = [
+            f'db;dur={fields["db_ms"]};desc="{fields["db_queries"]} queries"',
+            f'db-slowest;dur={fields["db_slowest_ms"]}',
+            f'db-repeated;desc="{fields["db_repeated"]} repeated, max {fields["db_most_repeated"]}x"',
+            f'tpl;dur={fields["template_ms"]}',
+            f'total;dur={fields["duration_ms"]}',
+        ]
+        if fields['response_bytes'] is not None:
+            metrics.append(f'size;desc="{fields["response_bytes"]} bytes"')
+        return ', '.join(metrics)
+
+
+def current_metrics():
+    """Return the RequestMetrics collecting for the code running now, or None."""
+    return _current_metrics.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # The same wrapper object outlives reconnects, so only install once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for RequestMetricsMiddleware."""
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            with RequestMetrics(detailed=self.sampled()) as metrics:
+                response = self.get_response(request)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+        return self.report(metrics, request, response)
+
+    async def __acall__(self, request):
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            with RequestMetrics(detailed=self.sampled()) as metrics:
+                response = await self.get_response(request)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+        return self.report(metrics, request, response)
+
+    def sampled(self):
+        rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def report(self, metrics, request, response):
+        elapsed = time.perf_counter() - metrics.started
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        REQUEST_LATENCY.observe(elapsed, view=view)
+        REQUEST_DB_QUERIES.observe(metrics.queries, view=view)
+        REQUEST_DB_TIME.observe(metrics.db_seconds, view=view)
+        if not metrics.detailed:
+            return response
+
+        fields = metrics.as_dict(request, response, elapsed)
+        response['Server-Timing'] = metrics.server_timing(fields)
+        level = logging.getLevelName(str(getattr(settings, 'REQUEST_METRICS_LOG_LEVEL', 'INFO')).upper())
+        logger.log(level, json.dumps(fields), extra={'request_metrics': fields})
+        return response
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from university.models import ClassSchedule, Semester
+from university.services import backfill_enrollments
+
+
+class Command(BaseCommand):
+    help = "Enroll each department's active students in its courses' class schedules"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', help='Only backfill class schedules of this semester code')
+
+    def handle(self, *args, **options):
+        class_schedules = ClassSchedule.objects.all()
+        if options['semester']:
+            try:
+                semester = Semester.objects.get(code=options['semester'])
+            except Semester.DoesNotExist:
+                raise CommandError(f'Semester with code "{options["semester"]}" does not exist')
+            class_schedules = class_schedules.filter(semester=semester)
+
+        count = backfill_enrollments(class_schedules)
+        self.stdout.write(self.style.SUCCESS(f'Processed {count} enrollments'))
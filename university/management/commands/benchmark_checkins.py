@@ -0,0 +1,114 @@
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from university.models import ClassSchedule
+from university.roster import roster_index
+
+
+async def post(host, port, path, body, headers):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = [f'POST {path} HTTP/1.1', f'Host: {host}:{port}', 'Connection: close',
+               'Content-Type: application/json', f'Content-Length: {len(body)}']
+    request += [f'{name}: {value}' for name, value in headers.items()]
+    writer.write(('\r\n'.join(request) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    body = (await reader.read()).partition(b'\r\n\r\n')[2]
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1]), body
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent mark-attendance check-ins at a running server, to compare e.g. '
+        '"gunicorn attendance_system.wsgi -w 4" with "uvicorn attendance_system.asgi:application"'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running server')
+        parser.add_argument('--requests', type=int, default=2000, help='Total check-ins to send')
+        parser.add_argument('--concurrency', type=int, default=500, help='Check-ins in flight at once')
+        parser.add_argument('--username', required=True, help='Staff user the check-ins are marked by')
+        parser.add_argument('--class-schedule', type=int, help='Class schedule id (default: first active one)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+        if options['class_schedule']:
+            class_schedule = ClassSchedule.objects.filter(pk=options['class_schedule']).first()
+        else:
+            class_schedule = ClassSchedule.objects.filter(is_active=True).first()
+        if class_schedule is None:
+            raise CommandError('No class schedule to check in to')
+        student_ids = roster_index.schedule_student_ids(class_schedule.id)
+        if not student_ids:
+            raise CommandError(f'Class schedule {class_schedule.id} has no enrolled students')
+
+        # A real session and a CSRF cookie/header pair, as a logged-in phone would send
+        client = Client()
+        client.force_login(user)
+        csrf_token = get_random_string(32)
+        headers = {
+            'Cookie': f'sessionid={client.cookies["sessionid"].value}; csrftoken={csrf_token}',
+            'X-CSRFToken': csrf_token,
+        }
+        url = urlsplit(options['url'])
+        bodies = [
+            json.dumps({
+                'student_id': student_ids[i % len(student_ids)],
+                'class_schedule_id': class_schedule.id,
+                'status': 'P',
+                'date': timezone.now().date().isoformat(),
+            }).encode()
+            for i in range(options['requests'])
+        ]
+
+        latencies, statuses, elapsed = asyncio.run(self.run(
+            url.hostname, url.port or 80, '/api/mark-attendance/', bodies, headers, options['concurrency']
+        ))
+
+        failed = Counter(status for status, body in statuses if status != 200)
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{len(bodies)} check-ins in {elapsed:.2f}s ({len(bodies) / elapsed:.0f}/s), '
+            f'{sum(failed.values())} failed{f" {dict(failed)}" if failed else ""}\n'
+            f'latency ms: p50 {quantiles[49] * 1000:.0f}, p95 {quantiles[94] * 1000:.0f}, '
+            f'p99 {quantiles[98] * 1000:.0f}, max {max(latencies) * 1000:.0f}'
+        )
+        errors = {}
+        for status, body in statuses:
+            if status != 200:
+                errors.setdefault(status, body)
+        for status, body in errors.items():
+            self.stdout.write(f'first {status} response: {body[:200].decode(errors="replace")}')
+
+    async def run(self, host, port, path, bodies, headers, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        statuses = []
+
+        async def check_in(body):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    statuses.append(await post(host, port, path, body, headers))
+                except OSError as e:
+                    statuses.append((None, str(e).encode()))
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(check_in(body) for body in bodies))
+        return latencies, statuses, time.perf_counter() - started
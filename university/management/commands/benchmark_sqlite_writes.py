@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.utils import ConnectionHandler, load_backend
+
+# Each transaction mirrors a roll call: insert one attendance row per
+# student, then bump a summary counter, so writers contend for the lock
+# the way bulk_attendance and the summary updates do.
+SCHEMA = [
+    'CREATE TABLE attendance (id INTEGER PRIMARY KEY, worker INTEGER, student INTEGER, status TEXT)',
+    'CREATE TABLE summary (id INTEGER PRIMARY KEY, present INTEGER NOT NULL)',
+    'INSERT INTO summary (id, present) VALUES (1, 0)',
+]
+
+PROFILES = {
+    'baseline': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'OPTIONS': {'timeout': 1},
+    },
+    'tuned': {
+        'ENGINE': 'attendance_system.sqlite3',
+        'OPTIONS': {
+            'pragmas': {
+                'journal_mode': 'wal',
+                'synchronous': 'normal',
+                'busy_timeout': 1000,
+                'cache_size': -20000,
+                'mmap_size': 134217728,
+                'temp_store': 'memory',
+            },
+            'transaction_mode': 'immediate',
+        },
+    },
+}
+
+
+def connect(profile, path):
+    """Register a ``bench`` connection for ``profile`` in this process and return it."""
+    # ConnectionHandler fills in the unset keys (AUTOCOMMIT, TIME_ZONE, ...)
+    settings_dict = ConnectionHandler({'default': {**PROFILES[profile], 'NAME': path}}).settings['default']
+    connections['bench'] = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, 'bench')
+    return connections['bench']
+
+
+def run_worker(profile, path, worker, transactions, rows, results):
+    connection = connect(profile, path)
+    committed = locked = 0
+    for _ in range(transactions):
+        try:
+            with transaction.atomic(using='bench'):
+                with connection.cursor() as cursor:
+                    # Read first, as the real write paths do, so a deferred
+                    # transaction has to upgrade its lock to write
+                    cursor.execute('SELECT present FROM summary WHERE id = 1')
+                    cursor.executemany(
+                        'INSERT INTO attendance (worker, student, status) VALUES (%s, %s, %s)',
+                        [(worker, student, 'P') for student in range(rows)],
+                    )
+                    cursor.execute('UPDATE summary SET present = present + %s WHERE id = 1', [rows])
+            committed += 1
+        except OperationalError:
+            locked += 1
+    connection.close()
+    results.put((committed, locked))
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent SQLite write throughput with the default and the tuned connection settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent writer processes')
+        parser.add_argument('--transactions', type=int, default=200, help='Transactions per worker')
+        parser.add_argument('--rows', type=int, default=30, help='Rows written per transaction')
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                            help='Profile to run (default: all)')
+
+    def handle(self, *args, **options):
+        for profile in options['profile'] or ['baseline', 'tuned']:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                connection = connect(profile, path)
+                with connection.cursor() as cursor:
+                    for statement in SCHEMA:
+                        cursor.execute(statement)
+                connection.close()
+
+                results = multiprocessing.Queue()
+                workers = [
+                    multiprocessing.Process(target=run_worker, args=(
+                        profile, path, worker, options['transactions'], options['rows'], results
+                    ))
+                    for worker in range(options['workers'])
+                ]
+                started = time.perf_counter()
+                for process in workers:
+                    process.start()
+                totals = [results.get() for _ in workers]
+                for process in workers:
+                    process.join()
+                elapsed = time.perf_counter() - started
+
+            committed = sum(result[0] for result in totals)
+            locked = sum(result[1] for result in totals)
+            self.stdout.write(
+                f'{profile:>8}: {committed} transactions committed, {locked} failed with "database is locked", '
+                f'{committed / elapsed:.0f} transactions/s, {committed * options["rows"] / elapsed:.0f} rows/s'
+            )
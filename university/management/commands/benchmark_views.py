@@ -0,0 +1,149 @@
+import json
+import platform
+import statistics
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from university.cache import local_cache
+from university.models import ClassSchedule, Enrollment
+from university.roster import roster_index
+from university.synthetic import seed_synthetic_university
+
+# A cache of its own, so benchmark runs never touch the version tokens or
+# cached values of the configured (possibly shared) cache
+BENCHMARK_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+    'ALLOWED_HOSTS': ['testserver'],
+}
+
+
+def clear_caches():
+    cache.clear()
+    local_cache.clear()
+    roster_index.clear()
+
+
+def endpoints():
+    """(name, method, path, data, content_type) for every benchmarked request."""
+    class_schedule = ClassSchedule.objects.select_related('course').order_by('id').first()
+    roster = list(Enrollment.objects.filter(class_schedule=class_schedule).values_list('student_id', flat=True))
+    today = timezone.now().date().isoformat()
+    return [
+        ('dashboard', 'get', reverse('dashboard'), None, None),
+        ('attendance_list', 'get', reverse('attendance_list'), None, None),
+        ('attendance_report', 'get', reverse('attendance_report'), {'course_id': class_schedule.course_id}, None),
+        ('bulk_attendance', 'post', reverse('bulk_attendance'), {
+            'class_schedule': class_schedule.id,
+            'date': today,
+            **{f'student_{student_id}': 'P' for student_id in roster},
+        }, None),
+        ('api-departments', 'get', reverse('api-departments'), None, None),
+        ('api-courses', 'get', reverse('api-courses'), None, None),
+        ('api-students', 'get', reverse('api-students'), None, None),
+        ('api-attendance', 'get', reverse('api-attendance'), None, None),
+        ('api-dashboard-stats', 'get', reverse('api-dashboard-stats'), None, None),
+        ('api-bulk-attendance', 'post', reverse('api-bulk-attendance'), json.dumps({
+            'class_schedule_id': class_schedule.id,
+            'date': today,
+            'attendance_data': [{'student_id': student_id, 'status': 'L'} for student_id in roster],
+        }), 'application/json'),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed synthetic universities of each size into a scratch database and record the latency and '
+        'query count of the main views against each, as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Dataset sizes to benchmark, in students')
+        parser.add_argument('--weeks', type=int, default=4, help='Weeks of attendance to seed')
+        parser.add_argument('--repeat', type=int, default=5, help='Warm runs per endpoint')
+        parser.add_argument('--output', default='benchmark-results.json', help='JSON file to write')
+
+    def handle(self, *args, **options):
+        runs = []
+        with override_settings(**BENCHMARK_SETTINGS):
+            for students in options['students']:
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    clear_caches()
+                    started = time.perf_counter()
+                    rows = seed_synthetic_university(students=students, weeks=options['weeks'])
+                    seed_seconds = time.perf_counter() - started
+                    self.stdout.write(f'{students} students: seeded {rows["attendance"]} attendance rows '
+                                      f'in {seed_seconds:.1f}s')
+                    runs.append({
+                        'students': students,
+                        'rows': rows,
+                        'seed_seconds': round(seed_seconds, 2),
+                        'endpoints': self.measure(options['repeat']),
+                    })
+                finally:
+                    clear_caches()
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'weeks': options['weeks'],
+            'repeat': options['repeat'],
+            'runs': runs,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+
+    def measure(self, repeat):
+        staff = User.objects.create_user('benchmark-staff', is_staff=True, is_superuser=True)
+        client = Client()
+        client.force_login(staff)
+
+        results = {}
+        for name, method, path, data, content_type in endpoints():
+            send = getattr(client, method)
+            kwargs = {'content_type': content_type} if content_type else {}
+            timings = []
+            queries = []
+            statuses = set()
+            clear_caches()
+            # The first run starts from empty caches, the rest are warm
+            for _ in range(repeat + 1):
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = send(path, data, **kwargs)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(context.captured_queries))
+                statuses.add(response.status_code)
+
+            warm = timings[1:]
+            results[name] = {
+                'method': method.upper(),
+                'path': path,
+                'status': sorted(statuses),
+                'cold_ms': round(timings[0], 2),
+                'cold_queries': queries[0],
+                'p50_ms': round(statistics.median(warm), 2),
+                'max_ms': round(max(warm), 2),
+                'queries': max(queries[1:]),
+            }
+            self.stdout.write(
+                f'  {name:<22} {results[name]["p50_ms"]:>9.1f} ms p50 {results[name]["queries"]:>4} queries '
+                f'(cold {results[name]["cold_ms"]:.1f} ms, {results[name]["cold_queries"]} queries)'
+            )
+        return results
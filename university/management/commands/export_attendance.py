@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from university.models import Course, Department, Semester
+from university.services import filter_attendance_export, stream_attendance_export
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Stream attendance for a semester, course or department as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', help='Semester code')
+        parser.add_argument('--course', help='Course code')
+        parser.add_argument('--department', help='Department code')
+        parser.add_argument('--start-date', type=parse_date, help='First date to include (YYYY-MM-DD)')
+        parser.add_argument('--end-date', type=parse_date, help='Last date to include (YYYY-MM-DD)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--output', help='File to write to (defaults to stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        filters = {
+            'start_date': options['start_date'],
+            'end_date': options['end_date'],
+        }
+        for name, model in [('semester', Semester), ('course', Course), ('department', Department)]:
+            if options[name]:
+                try:
+                    filters[name] = model.objects.get(code=options[name])
+                except model.DoesNotExist:
+                    raise CommandError(f'{model.__name__} with code "{options[name]}" does not exist')
+
+        lines = stream_attendance_export(
+            filter_attendance_export(**filters), options['format'], options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
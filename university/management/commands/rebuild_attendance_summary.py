@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from university.models import AttendanceSummary
+from university.services import count_attendance_summary, rebuild_attendance_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the AttendanceSummary table from Attendance, or verify it against a full recount'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Compare the stored summaries with a recount instead of rebuilding them',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            count = rebuild_attendance_summary()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} attendance summaries'))
+            return
+
+        fields = list(AttendanceSummary.STATUS_FIELDS.values())
+        expected = count_attendance_summary()
+        stored = {
+            (row['student_id'], row['course_id'], row['semester_id']): {field: row[field] for field in fields}
+            for row in AttendanceSummary.objects.values('student_id', 'course_id', 'semester_id', *fields)
+        }
+        empty = dict.fromkeys(fields, 0)
+
+        mismatches = 0
+        for key in sorted(expected.keys() | stored.keys()):
+            actual = stored.get(key, empty)
+            wanted = expected.get(key, empty)
+            if actual != wanted:
+                mismatches += 1
+                student_id, course_id, semester_id = key
+                self.stdout.write(
+                    f'student={student_id} course={course_id} semester={semester_id}: '
+                    f'stored {actual}, expected {wanted}'
+                )
+
+        if mismatches:
+            raise CommandError(f'{mismatches} attendance summaries do not match the Attendance table')
+        self.stdout.write(self.style.SUCCESS(f'All {len(expected)} attendance summaries match'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from university.models import Semester
+from university.synthetic import seed_synthetic_university
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic university (departments through a semester of attendance) for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--departments', type=int, default=10)
+        parser.add_argument('--courses-per-department', type=int, default=10)
+        parser.add_argument('--teachers-per-department', type=int, default=5)
+        parser.add_argument('--schedules-per-course', type=int, default=1)
+        parser.add_argument('--courses-per-student', type=int, default=5)
+        parser.add_argument('--weeks', type=int, default=15, help='Weeks of attendance, ending this week')
+        parser.add_argument('--prefix', default='SYN', help='Prefix for every code and username (max 5 characters)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if not 0 < len(prefix) <= 5:
+            raise CommandError('--prefix must be 1 to 5 characters long')
+        if Semester.objects.filter(code=f'{prefix}SEM').exists():
+            raise CommandError(f'A synthetic university with prefix "{prefix}" already exists')
+
+        started = time.perf_counter()
+        counts = seed_synthetic_university(
+            students=options['students'],
+            departments=options['departments'],
+            courses_per_department=options['courses_per_department'],
+            teachers_per_department=options['teachers_per_department'],
+            schedules_per_course=options['schedules_per_course'],
+            courses_per_student=options['courses_per_student'],
+            weeks=options['weeks'],
+            prefix=prefix,
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(', '.join(f'{count} {name.replace("_", " ")}' for name, count in counts.items()))
+        self.stdout.write(self.style.SUCCESS(f'Seeded synthetic university "{prefix}" in {elapsed:.1f}s'))
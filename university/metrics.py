@@ -0,0 +1,376 @@
+"""
+Prometheus metrics, served in the text exposition format by the ``metrics`` view.
+
+Counters, gauges and histograms live in a per-process store, so recording a
+value never waits on another process. Without METRICS_DIR the store is a
+dict, which is enough for a single process (runserver, tests). With
+METRICS_DIR every process writes to its own memory-mapped file in that
+directory, and a scrape sums the files of all of them. Gauges only count
+for processes that are still alive, while counters and histograms from
+workers that exited are kept so totals never go backwards. Empty the
+directory before the server starts.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import Counter as Tally, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Each file starts with the number of bytes in use, padded to 8 bytes, then
+# holds (key length, key, padding, float64 value) entries
+_USED = struct.Struct('i')
+_KEY_LENGTH = struct.Struct('i')
+_VALUE = struct.Struct('d')
+INITIAL_FILE_SIZE = 64 * 1024
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _read_entries(data, used):
+    """Yield (key, value, value position) for every entry of a store file."""
+    position = 8
+    while position < used:
+        length, = _KEY_LENGTH.unpack_from(data, position)
+        key = bytes(data[position + 4:position + 4 + length]).decode()
+        value_position = position + 4 + length
+        value_position += -value_position % 8
+        yield key, _VALUE.unpack_from(data, value_position)[0], value_position
+        position = value_position + 8
+
+
+def read_store_file(path):
+    """Return the {key: value} entries of a store file written by any process."""
+    data = Path(path).read_bytes()
+    if len(data) < 8:
+        return {}
+    used, = _USED.unpack_from(data, 0)
+    return {key: value for key, value, _ in _read_entries(data, used)}
+
+
+class ValueStore:
+    """Values of one process, kept in memory."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = float(value)
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class MmapValueStore:
+    """
+    Values of one process, kept in a memory-mapped file.
+
+    Only the owning process writes to the file. An entry is written in full
+    before the bytes-in-use header moves past it, so other processes reading
+    the file never see a partial entry.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._file.truncate(INITIAL_FILE_SIZE)
+            size = INITIAL_FILE_SIZE
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._used, = _USED.unpack_from(self._mmap, 0)
+        if self._used == 0:
+            self._used = 8
+            _USED.pack_into(self._mmap, 0, self._used)
+        self._positions = {key: position for key, _, position in _read_entries(self._mmap, self._used)}
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+        encoded = key.encode()
+        value_position = self._used + 4 + len(encoded)
+        value_position += -value_position % 8
+        end = value_position + 8
+        if end > len(self._mmap):
+            self._mmap.resize(max(len(self._mmap) * 2, end))
+        _KEY_LENGTH.pack_into(self._mmap, self._used, len(encoded))
+        self._mmap[self._used + 4:self._used + 4 + len(encoded)] = encoded
+        _VALUE.pack_into(self._mmap, value_position, 0.0)
+        self._used = end
+        _USED.pack_into(self._mmap, 0, end)
+        self._positions[key] = value_position
+        return value_position
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._position(key)
+            _VALUE.pack_into(self._mmap, position, _VALUE.unpack_from(self._mmap, position)[0] + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            _VALUE.pack_into(self._mmap, self._position(key), float(value))
+
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, value, _ in _read_entries(self._mmap, self._used)]
+
+
+# One store per kind ('counter' or 'gauge') in this process
+_stores = {}
+_stores_lock = threading.Lock()
+# A forked worker must not write to its parent's files
+os.register_at_fork(after_in_child=_stores.clear)
+
+
+def _store(kind):
+    store = _stores.get(kind)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(kind)
+            if store is None:
+                directory = getattr(settings, 'METRICS_DIR', '')
+                if directory:
+                    store = MmapValueStore(Path(directory) / f'{kind}_{os.getpid()}.db')
+                else:
+                    store = ValueStore()
+                _stores[kind] = store
+    return store
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Return the {key: value} totals across processes and the number of live processes."""
+    totals = defaultdict(float)
+    directory = getattr(settings, 'METRICS_DIR', '')
+    if not directory:
+        for store in list(_stores.values()):
+            for key, value in store.items():
+                totals[key] += value
+        return totals, 1
+
+    live = set()
+    for path in Path(directory).glob('*.db'):
+        kind, _, pid = path.stem.partition('_')
+        if not pid.isdigit():
+            continue
+        alive = int(pid) == os.getpid() or _pid_alive(int(pid))
+        if alive:
+            live.add(pid)
+        elif kind == 'gauge':
+            continue
+        for key, value in read_store_file(path).items():
+            totals[key] += value
+    return totals, len(live)
+
+
+_metrics = []
+_metrics_by_sample = {}
+
+
+def _escape_label(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    type = None
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+        _metrics.append(self)
+        for sample in self.sample_names():
+            _metrics_by_sample[sample] = self
+
+    def sample_names(self):
+        return [self.name]
+
+    def _labelvalues(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _key(self, labels):
+        labelvalues = self._labelvalues(labels)
+        key = self._keys.get(labelvalues)
+        if key is None:
+            key = self._keys[labelvalues] = json.dumps([self.name, labelvalues])
+        return key
+
+    def _sample_line(self, sample, labelnames, labelvalues, value):
+        labels = ','.join(f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, labelvalues))
+        return f'{sample}{{{labels}}} {_format_value(value)}' if labels else f'{sample} {_format_value(value)}'
+
+    def render(self, samples):
+        """Exposition lines for this metric's (sample, labelvalues, value) totals."""
+        return [
+            self._sample_line(sample, self.labelnames, labelvalues, value)
+            for sample, labelvalues, value in sorted(samples)
+        ]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _store(self.kind).add(self._key(labels), amount)
+
+
+class Gauge(Metric):
+    """A gauge summed over the processes that are still alive."""
+
+    type = 'gauge'
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        _store(self.kind).add(self._key(labels), amount)
+
+    def dec(self, amount=1, **labels):
+        _store(self.kind).add(self._key(labels), -amount)
+
+    def set(self, value, **labels):
+        _store(self.kind).set(self._key(labels), value)
+
+
+class Histogram(Metric):
+    """
+    A histogram with fixed bucket upper bounds.
+
+    Each observation is added to the one bucket it falls in, plus the sum
+    and count. Buckets are made cumulative when rendered.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def sample_names(self):
+        return [f'{self.name}_bucket', f'{self.name}_sum', f'{self.name}_count']
+
+    def _key(self, labels):
+        labelvalues = self._labelvalues(labels)
+        keys = self._keys.get(labelvalues)
+        if keys is None:
+            keys = self._keys[labelvalues] = (
+                [json.dumps([f'{self.name}_bucket', [*labelvalues, _format_value(bound)]]) for bound in self.buckets],
+                json.dumps([f'{self.name}_sum', labelvalues]),
+                json.dumps([f'{self.name}_count', labelvalues]),
+            )
+        return keys
+
+    def observe(self, value, **labels):
+        buckets, sum_key, count_key = self._key(labels)
+        store = _store(self.kind)
+        index = bisect_left(self.buckets, value)
+        if index < len(buckets):
+            store.add(buckets[index], 1)
+        store.add(sum_key, value)
+        store.add(count_key, 1)
+
+    def render(self, samples):
+        series = defaultdict(lambda: {'buckets': Tally(), 'sum': 0.0, 'count': 0.0})
+        for sample, labelvalues, value in samples:
+            if sample.endswith('_bucket'):
+                series[tuple(labelvalues[:-1])]['buckets'][labelvalues[-1]] += value
+            elif sample.endswith('_sum'):
+                series[tuple(labelvalues)]['sum'] += value
+            else:
+                series[tuple(labelvalues)]['count'] += value
+
+        lines = []
+        labelnames = (*self.labelnames, 'le')
+        for labelvalues, totals in sorted(series.items()):
+            cumulative = 0.0
+            for bound in self.buckets:
+                cumulative += totals['buckets'][_format_value(bound)]
+                lines.append(self._sample_line(
+                    f'{self.name}_bucket', labelnames, (*labelvalues, _format_value(bound)), cumulative
+                ))
+            lines.append(self._sample_line(f'{self.name}_bucket', labelnames, (*labelvalues, '+Inf'), totals['count']))
+            lines.append(self._sample_line(f'{self.name}_sum', self.labelnames, labelvalues, totals['sum']))
+            lines.append(self._sample_line(f'{self.name}_count', self.labelnames, labelvalues, totals['count']))
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to respond to a request, by URL name.', ['view'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries run per request, by URL name.', ['view'], buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in SQL queries per request, by URL name.', ['view'],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Requests being handled right now, across all worker processes.',
+)
+WORKER_PROCESSES = Gauge(
+    'worker_processes', 'Live worker processes that have recorded metrics.',
+)
+ATTENDANCE_ROWS_WRITTEN = Counter(
+    'attendance_rows_written_total', 'Attendance rows created or updated, by write path and status.',
+    ['path', 'status'],
+)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total',
+    'Cache lookups by kind of value and where they were answered: local (per-process LRU), shared or miss.',
+    ['kind', 'result'],
+)
+
+
+def count_attendance_written(path, statuses):
+    """Count attendance rows written by ``path``, one per status in ``statuses``."""
+    for status, count in Tally(statuses).items():
+        ATTENDANCE_ROWS_WRITTEN.inc(count, path=path, status=status)
+
+
+def render_metrics():
+    """Return every metric, summed across processes, in the text exposition format."""
+    totals, processes = collect()
+    samples = defaultdict(list)
+    for key, value in totals.items():
+        sample, labelvalues = json.loads(key)
+        metric = _metrics_by_sample.get(sample)
+        # Values of metrics that no longer exist are skipped
+        if metric is not None:
+            samples[metric].append((sample, labelvalues, value))
+    samples[WORKER_PROCESSES] = [(WORKER_PROCESSES.name, [], processes)]
+
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.render(samples.get(metric, [])))
+    return '\n'.join(lines) + '\n'
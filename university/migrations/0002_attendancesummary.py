@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:33
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def backfill_attendance_summary(apps, schema_editor):
+    Attendance = apps.get_model('university', 'Attendance')
+    AttendanceSummary = apps.get_model('university', 'AttendanceSummary')
+    rows = Attendance.objects.values(
+        'student_id', 'class_schedule__course_id', 'class_schedule__semester_id'
+    ).annotate(
+        present=Count('id', filter=Q(status='P')),
+        absent=Count('id', filter=Q(status='A')),
+        late=Count('id', filter=Q(status='L')),
+        excused=Count('id', filter=Q(status='E')),
+    ).order_by()
+    AttendanceSummary.objects.bulk_create([
+        AttendanceSummary(
+            student_id=row['student_id'],
+            course_id=row['class_schedule__course_id'],
+            semester_id=row['class_schedule__semester_id'],
+            present=row['present'],
+            absent=row['absent'],
+            late=row['late'],
+            excused=row['excused'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('university', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('absent', models.PositiveIntegerField(default=0)),
+                ('late', models.PositiveIntegerField(default=0)),
+                ('excused', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='university.course')),
+                ('semester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='university.semester')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='university.student')),
+            ],
+            options={
+                'verbose_name_plural': 'attendance summaries',
+                'unique_together': {('student', 'course', 'semester')},
+            },
+        ),
+        migrations.RunPython(backfill_attendance_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_enrollments(apps, schema_editor):
+    # Until now a class's roster was every active student of its course's department
+    ClassSchedule = apps.get_model('university', 'ClassSchedule')
+    Enrollment = apps.get_model('university', 'Enrollment')
+    Student = apps.get_model('university', 'Student')
+    for class_schedule_id, department_id in ClassSchedule.objects.values_list('id', 'course__department_id'):
+        student_ids = Student.objects.filter(
+            department_id=department_id, is_active=True
+        ).values_list('id', flat=True)
+        Enrollment.objects.bulk_create([
+            Enrollment(student_id=student_id, class_schedule_id=class_schedule_id)
+            for student_id in student_ids
+        ], batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('university', '0002_attendancesummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Enrollment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enrolled_at', models.DateTimeField(auto_now_add=True)),
+                ('class_schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='university.classschedule')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='university.student')),
+            ],
+            options={
+                'ordering': ['class_schedule', 'student__student_id'],
+                'unique_together': {('class_schedule', 'student')},
+            },
+        ),
+        migrations.RunPython(backfill_enrollments, migrations.RunPython.noop),
+    ]
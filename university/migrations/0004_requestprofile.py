@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('university', '0003_enrollment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.CharField(max_length=29, primary_key=True, serialize=False)),
+            ],
+            options={
+                'verbose_name': 'slow request profile',
+                'managed': False,
+            },
+        ),
+    ]
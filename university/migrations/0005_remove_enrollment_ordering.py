@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('university', '0004_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='enrollment',
+            options={},
+        ),
+    ]
@@ -110,6 +110,18 @@ class ClassSchedule(models.Model):
     def __str__(self):
         return f"{self.course.code} - {self.get_day_of_week_display()} {self.start_time}"
 
+class Enrollment(models.Model):
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    class_schedule = models.ForeignKey(ClassSchedule, on_delete=models.CASCADE)
+    enrolled_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        # Leads with class_schedule so roster lookups are an index range scan
+        unique_together = ['class_schedule', 'student']
+    
+    def __str__(self):
+        return f"{self.student_id} in {self.class_schedule_id}"
+
 class Attendance(models.Model):
     STATUS_CHOICES = [
         ('P', 'Present'),
@@ -156,6 +168,34 @@ class AttendanceLog(models.Model):
     class Meta:
         ordering = ['-timestamp']
 
+class AttendanceSummary(models.Model):
+    STATUS_FIELDS = {
+        'P': 'present',
+        'A': 'absent',
+        'L': 'late',
+        'E': 'excused',
+    }
+    
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    semester = models.ForeignKey(Semester, on_delete=models.CASCADE)
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    excused = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['student', 'course', 'semester']
+        verbose_name_plural = 'attendance summaries'
+    
+    def __str__(self):
+        return f"{self.student_id} - {self.course_id} - {self.semester_id}"
+    
+    @property
+    def total(self):
+        return self.present + self.absent + self.late + self.excused
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
@@ -165,4 +205,17 @@ class Notification(models.Model):
     link = models.CharField(max_length=200, blank=True)
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class RequestProfile(models.Model):
+    """
+    A profile of a slow request, for the admin.
+
+    Profiles are files in SLOW_REQUEST_PROFILE_DIR (see university.profiling),
+    not rows, so this model has no table.
+    """
+    id = models.CharField(max_length=29, primary_key=True)
+    
+    class Meta:
+        managed = False
+        verbose_name = 'slow request profile'
@@ -0,0 +1,258 @@
+"""
+Profiles of slow requests.
+
+SlowRequestProfilerMiddleware has a background thread sample the stack of
+the thread handling each request every SLOW_REQUEST_SAMPLE_INTERVAL_MS.
+The samples are thrown away unless the request took
+SLOW_REQUEST_THRESHOLD_MS or longer. Slow requests are kept in
+SLOW_REQUEST_PROFILE_DIR, which holds at most SLOW_REQUEST_PROFILE_MAX
+profiles: the oldest are deleted as new ones arrive.
+
+Sampling is not free. The sampler holds the GIL while it walks and folds
+the stacks, and request threads wait for it, so every request in the
+process slows down a little, more so the more requests are in flight.
+The default 10 ms interval keeps that overhead small enough to leave
+profiling on; shorter intervals give finer profiles at a higher cost.
+
+Each profile is a ``<id>.json`` file with the request's details, next to a
+``<id>.folded`` file of "frame;frame;frame count" lines, the input format
+of flamegraph.pl and speedscope. Staff browse them in the admin under
+"Slow request profiles".
+
+Only requests handled on a thread of their own are profiled, which means
+every request under WSGI. Under ASGI, requests share the event loop
+thread, so they are passed through unprofiled.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+
+from .instrumentation import current_metrics
+
+PROFILE_ID = re.compile(r'^\d{20}-[0-9a-f]{8}$')
+
+
+class StackSampler:
+    """Samples the stacks of registered threads from one background thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = None
+
+    def start(self, ident):
+        with self._lock:
+            self._stacks[ident] = Counter()
+            self._active.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, ident):
+        """Stop sampling ``ident`` and return its folded stacks and their sample counts."""
+        with self._lock:
+            stacks = self._stacks.pop(ident, Counter())
+            if not self._stacks:
+                self._active.clear()
+        return stacks
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                sampled = [(ident, stacks) for ident, stacks in self._stacks.items() if ident in frames]
+            # Folded outside the lock, so start() and stop() never wait for it
+            folded = [(ident, stacks, fold(frames[ident])) for ident, stacks in sampled]
+            # The frames keep every thread's locals alive
+            del frames
+            with self._lock:
+                for ident, stacks, stack in folded:
+                    # Skip requests that ended meanwhile, even if another began on the same thread
+                    if self._stacks.get(ident) is stacks:
+                        stacks[stack] += 1
+
+
+@lru_cache(maxsize=4096)
+def _frame_label(code):
+    filename = code.co_filename
+    for prefix in sorted(map(str, [settings.BASE_DIR, *sys.path]), key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    name = getattr(code, 'co_qualname', code.co_name)
+    # ';' separates frames in the folded format
+    return f'{name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+def fold(frame):
+    """Return the stack ending at ``frame`` as 'root;...;leaf'."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def _reset_sampler():
+    global _sampler
+    _sampler = None
+
+
+# The sampling thread does not survive a fork
+os.register_at_fork(after_in_child=_reset_sampler)
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = StackSampler(settings.SLOW_REQUEST_SAMPLE_INTERVAL_MS / 1000)
+    return _sampler
+
+
+def profile_dir():
+    return Path(settings.SLOW_REQUEST_PROFILE_DIR)
+
+
+def save_profile(details, stacks):
+    """Store a profile and delete the oldest beyond SLOW_REQUEST_PROFILE_MAX. Returns its id."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Ids sort in the order profiles were taken
+    profile_id = f'{time.time_ns():020}-{uuid.uuid4().hex[:8]}'
+    details = {'id': profile_id, 'samples': sum(stacks.values()), **details}
+
+    folded = ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+    for suffix, content in [('.folded', folded), ('.json', json.dumps(details))]:
+        # Written under a temporary name, so readers never see half a file
+        temporary = directory / f'.{profile_id}{suffix}.tmp'
+        temporary.write_text(content)
+        os.replace(temporary, directory / f'{profile_id}{suffix}')
+
+    for old_id in profile_ids()[settings.SLOW_REQUEST_PROFILE_MAX:]:
+        delete_profile(old_id)
+    return profile_id
+
+
+def profile_ids():
+    """Ids of the stored profiles, newest first."""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    return sorted((path.stem for path in directory.glob('*.json') if PROFILE_ID.match(path.stem)), reverse=True)
+
+
+def load_profile(profile_id):
+    """Return the details of a stored profile, or None if there is no such profile."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        return json.loads((profile_dir() / f'{profile_id}.json').read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def load_folded(profile_id):
+    """Return the folded stacks of a stored profile, or None if there is no such profile."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        return (profile_dir() / f'{profile_id}.folded').read_text()
+    except FileNotFoundError:
+        return None
+
+
+def delete_profile(profile_id):
+    for suffix in ('.json', '.folded'):
+        # Another process may be pruning the same profile
+        try:
+            (profile_dir() / f'{profile_id}{suffix}').unlink()
+        except FileNotFoundError:
+            pass
+
+
+def top_frames(folded, limit=30):
+    """
+    Return the ``limit`` frames where the most samples were taken, as
+    (frame, own samples, total samples) tuples.
+
+    Own samples have the frame at the top of the stack, so they point at
+    where the time went; total samples have it anywhere in the stack.
+    """
+    own = Counter()
+    total = Counter()
+    for line in folded.splitlines():
+        stack, _, count = line.rpartition(' ')
+        frames = stack.split(';')
+        count = int(count)
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    frames = sorted(total, key=lambda frame: (own[frame], total[frame]), reverse=True)
+    return [(frame, own[frame], total[frame]) for frame in frames[:limit]]
+
+
+class SlowRequestProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.get_response(request)
+        if not settings.SLOW_REQUEST_PROFILE_DIR:
+            return self.get_response(request)
+
+        sampler = get_sampler()
+        ident = threading.get_ident()
+        started = time.perf_counter()
+        sampler.start(ident)
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.stop(ident)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            self.save(request, response, elapsed_ms, stacks)
+        return response
+
+    def save(self, request, response, elapsed_ms, stacks):
+        match = request.resolver_match
+        metrics = current_metrics()
+        save_profile({
+            'created_at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(elapsed_ms, 2),
+            'db_queries': metrics.queries if metrics else None,
+            'db_ms': round(metrics.db_seconds * 1000, 2) if metrics else None,
+            'interval_ms': settings.SLOW_REQUEST_SAMPLE_INTERVAL_MS,
+            'pid': os.getpid(),
+        }, stacks)
@@ -0,0 +1,256 @@
+"""
+In-process index of class rosters.
+
+Every roster view used to rebuild "the students of this class" with a join
+on each request. The index keeps, per process, a compact table of active
+students and the class schedule -> enrolled student ids mapping, so a roster
+lookup is a dict access. Each part of the index is tied to the version tokens of the data it
+was built from and is rebuilt on its own when another process (or this one)
+bumps one of them. Single-row writes to students, their users, class
+schedules and enrollments only reload the rows written.
+"""
+import threading
+from array import array
+from collections import defaultdict
+from operator import attrgetter
+
+from .cache import bump_version_with_change, changes_since, get_versions
+from .models import ClassSchedule, Enrollment, Student
+from .routers import use_primary
+
+
+class StudentRecord:
+    __slots__ = ('id', 'student_id', 'name', 'email', 'department_id')
+
+    def __init__(self, id, student_id, name, email, department_id):
+        self.id = id
+        self.student_id = student_id
+        self.name = name
+        self.email = email
+        self.department_id = department_id
+
+    def __str__(self):
+        return f"{self.student_id} - {self.name}"
+
+
+class RosterIndex:
+    """
+    Per-process roster index.
+
+    ``students`` maps student pk to a StudentRecord for every active student.
+    ``schedule_rosters`` maps a class schedule id to a sorted ``array('q')``
+    of the pks of its enrolled active students, and ``schedule_courses`` maps
+    class schedules to their course.
+
+    Saves and deletes of single students, their users, class schedules and
+    enrollments are recorded with bump_version_with_change(), so the index
+    reloads just those rows. Any other bump (bulk writes, an evicted change
+    log, a fresh process) reloads the part it covers from scratch.
+    """
+    # scope: the part of the index it covers
+    PARTS = {
+        'students': 'students',
+        # Names and emails, changed one student at a time
+        'student-users': 'students',
+        # Department names are loaded with the students, and renames are rare
+        'departments': 'students',
+        'class-schedules': 'schedules',
+        'enrollments': 'enrollments',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._tokens = {}
+        self.students = {}
+        self.department_names = {}
+        self.schedule_rosters = {}
+        self.schedule_courses = {}
+        self.enrollments = {}
+
+    @use_primary
+    def _refresh(self):
+        tokens = dict(zip(self.PARTS, get_versions(*self.PARTS)))
+        if tokens == self._tokens:
+            return
+        with self._lock:
+            stale = {scope for scope, token in tokens.items() if self._tokens.get(scope) != token}
+            reload = set()
+            changed = defaultdict(set)
+            for scope in stale:
+                changes = changes_since(scope, self._tokens.get(scope), tokens[scope])
+                if changes is None:
+                    reload.add(self.PARTS[scope])
+                else:
+                    changed[self.PARTS[scope]].update(changes)
+
+            if 'students' in reload:
+                self._load_students()
+            elif changed['students']:
+                self._load_student_records(changed['students'])
+            if {'schedules', 'enrollments'} <= reload:
+                self._load_schedules_and_enrollments()
+            elif 'schedules' in reload:
+                self._load_schedules()
+            elif changed['schedules']:
+                self._load_schedule_records(changed['schedules'])
+            if 'enrollments' in reload and 'schedules' not in reload:
+                self._load_enrollments()
+            elif changed['enrollments']:
+                self._load_student_enrollments(changed['enrollments'])
+
+            if reload:
+                self._load_rosters()
+            elif changed:
+                self._load_rosters(changed['students'] | changed['enrollments'], changed['schedules'])
+            self._tokens = tokens
+
+    # The loaders below replace each dict rather than change it, so readers
+    # on other threads never iterate over a dict that is being changed
+
+    def _student_records(self, students):
+        """StudentRecords of the active ``students``, and the names of their departments."""
+        records = {}
+        department_names = {}
+        for pk, student_id, first_name, last_name, email, department_id, department_name in students.filter(
+            is_active=True
+        ).order_by().values_list(
+            'id', 'student_id', 'user__first_name', 'user__last_name', 'user__email',
+            'department_id', 'department__name',
+        ):
+            records[pk] = StudentRecord(pk, student_id, f'{first_name} {last_name}'.strip(), email, department_id)
+            department_names[department_id] = department_name
+        return records, department_names
+
+    def _load_students(self):
+        self.students, self.department_names = self._student_records(Student.objects.all())
+
+    def _load_student_records(self, student_ids):
+        # Deleted and deactivated students drop out
+        students = {pk: record for pk, record in self.students.items() if pk not in student_ids}
+        records, department_names = self._student_records(Student.objects.filter(pk__in=student_ids))
+        students.update(records)
+        self.department_names = {**self.department_names, **department_names}
+        self.students = students
+
+    def _load_schedules(self):
+        self.schedule_courses = dict(ClassSchedule.objects.order_by().values_list('id', 'course_id'))
+
+    def _load_schedule_records(self, class_schedule_ids):
+        schedule_courses = {
+            pk: course_id for pk, course_id in self.schedule_courses.items() if pk not in class_schedule_ids
+        }
+        schedule_courses.update(
+            ClassSchedule.objects.filter(pk__in=class_schedule_ids).order_by().values_list('id', 'course_id')
+        )
+        self.schedule_courses = schedule_courses
+
+    def _enrollment_arrays(self, enrollments):
+        """Group (class schedule id, student id) pairs into arrays of student ids."""
+        student_ids = defaultdict(list)
+        for class_schedule_id, student_id in enrollments:
+            student_ids[class_schedule_id].append(student_id)
+        return {class_schedule_id: array('q', ids) for class_schedule_id, ids in student_ids.items()}
+
+    def _load_enrollments(self):
+        self.enrollments = self._enrollment_arrays(
+            Enrollment.objects.order_by().values_list('class_schedule_id', 'student_id')
+        )
+
+    def _load_schedules_and_enrollments(self):
+        # One query for both on a cold start: schedules without enrollments
+        # come back once, with no student
+        schedule_courses = {}
+        enrollments = []
+        for class_schedule_id, course_id, student_id in ClassSchedule.objects.order_by().values_list(
+            'id', 'course_id', 'enrollment__student_id'
+        ):
+            schedule_courses[class_schedule_id] = course_id
+            if student_id is not None:
+                enrollments.append((class_schedule_id, student_id))
+        self.schedule_courses = schedule_courses
+        self.enrollments = self._enrollment_arrays(enrollments)
+
+    def _load_student_enrollments(self, student_ids):
+        """Reload the enrollments of ``student_ids``, wherever they were or now are."""
+        current = self._enrollment_arrays(
+            Enrollment.objects.filter(student_id__in=student_ids).order_by().values_list(
+                'class_schedule_id', 'student_id'
+            )
+        )
+        enrollments = {}
+        for class_schedule_id in self.enrollments.keys() | current.keys():
+            kept = self.enrollments.get(class_schedule_id, ())
+            if not student_ids.isdisjoint(kept):
+                kept = [pk for pk in kept if pk not in student_ids]
+            merged = array('q', kept)
+            merged.extend(current.get(class_schedule_id, ()))
+            if merged:
+                enrollments[class_schedule_id] = merged
+        self.enrollments = enrollments
+
+    def _roster(self, student_ids):
+        students = self.students
+        return array('q', sorted(pk for pk in student_ids if pk in students))
+
+    def _load_rosters(self, student_ids=None, class_schedule_ids=()):
+        """
+        Rebuild the rosters from ``enrollments`` and ``students``: all of
+        them, or only those of ``class_schedule_ids`` and of the schedules
+        ``student_ids`` are or were enrolled in.
+        """
+        if student_ids is None:
+            self.schedule_rosters = {
+                class_schedule_id: self._roster(ids) for class_schedule_id, ids in self.enrollments.items()
+            }
+            return
+        rosters = {}
+        for class_schedule_id in self.schedule_rosters.keys() | self.enrollments.keys():
+            roster = self.schedule_rosters.get(class_schedule_id, ())
+            enrolled = self.enrollments.get(class_schedule_id, ())
+            if (
+                class_schedule_id in class_schedule_ids
+                or not student_ids.isdisjoint(roster)
+                or not student_ids.isdisjoint(enrolled)
+            ):
+                roster = self._roster(enrolled)
+            if roster:
+                rosters[class_schedule_id] = roster
+        self.schedule_rosters = rosters
+
+    def has_schedule(self, class_schedule_id):
+        self._refresh()
+        return class_schedule_id in self.schedule_courses
+
+    def course_student_ids(self, course_id):
+        """Sorted pks of the active students enrolled in any class of a course."""
+        self._refresh()
+        student_ids = set()
+        for class_schedule_id, schedule_course_id in self.schedule_courses.items():
+            if schedule_course_id == course_id:
+                student_ids.update(self.schedule_rosters.get(class_schedule_id, ()))
+        return array('q', sorted(student_ids))
+
+    def schedule_student_ids(self, class_schedule_id):
+        """Sorted pks of the active students enrolled in a class schedule."""
+        self._refresh()
+        return self.schedule_rosters.get(class_schedule_id, array('q'))
+
+    def records(self, student_ids):
+        """StudentRecords for ``student_ids``, ordered by student number."""
+        students = self.students
+        return sorted((students[pk] for pk in student_ids if pk in students), key=attrgetter('student_id'))
+
+
+roster_index = RosterIndex()
+
+
+def bump_roster_version(scope, pk):
+    """
+    Note a save or delete of one row in a roster scope: the pk of a student
+    for 'students', 'student-users' and 'enrollments', of a class schedule
+    for 'class-schedules'.
+    """
+    bump_version_with_change(scope, pk)
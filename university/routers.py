@@ -0,0 +1,142 @@
+"""
+Read-replica routing.
+
+When a ``replica`` database is configured, ReplicaRoutingMiddleware lets
+the reads of GET and HEAD requests go to it. Everything else uses
+``default``:
+
+* writes, and any read inside a transaction on ``default``;
+* the rest of a request once it has written anything;
+* every request from a client that wrote in the last REPLICA_PIN_SECONDS,
+  tracked with a cookie, so a redirect after a POST reads its own writes;
+* views and blocks wrapped in ``use_primary``, which is also used wherever
+  query results are cached, so replication lag never ends up in a cache.
+"""
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    __slots__ = ('read_from_replica', 'wrote')
+
+    def __init__(self, read_from_replica):
+        self.read_from_replica = read_from_replica
+        self.wrote = False
+
+
+_request_state = ContextVar('request_routing_state', default=None)
+_force_primary = ContextVar('force_primary', default=False)
+
+
+class UsePrimary(ContextDecorator):
+    def _recreate_cm(self):
+        # A fresh instance per call, so concurrent calls never share a token
+        return type(self)()
+
+    def __call__(self, func):
+        if not iscoroutinefunction(func):
+            return super().__call__(func)
+
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            with self._recreate_cm():
+                return await func(*args, **kwargs)
+        return inner
+
+    def __enter__(self):
+        self._token = _force_primary.set(True)
+        return self
+
+    def __exit__(self, *exc_info):
+        _force_primary.reset(self._token)
+
+
+def use_primary(func=None):
+    """
+    Send every read to the primary database, as a decorator or context manager.
+
+    Views decorated with ``@use_primary`` opt out of replica reads.
+    """
+    if callable(func):
+        return UsePrimary()(func)
+    return UsePrimary()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if (
+            state is None
+            or not state.read_from_replica
+            or state.wrote
+            or _force_primary.get()
+            or REPLICA_DB_ALIAS not in connections.settings
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = self.routing_state(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.pin_primary(state, response)
+
+    async def __acall__(self, request):
+        state = self.routing_state(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.pin_primary(state, response)
+
+    def routing_state(self, request):
+        return RoutingState(
+            read_from_replica=request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+        )
+
+    def pin_primary(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5), httponly=True, samesite='Lax'
+            )
+        return response
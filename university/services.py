@@ -0,0 +1,498 @@
+import csv
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, F, Func, IntegerField, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .cache import bump_versions, cached_queryset, get_versions, shared_get
+from .models import (
+    Attendance, AttendanceLog, AttendanceSummary, ClassSchedule, Course, Department, Enrollment, Student,
+    Teacher,
+)
+from .roster import roster_index
+from .routers import use_primary
+
+VALID_STATUSES = {code for code, label in Attendance.STATUS_CHOICES}
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that encode_cursor() did not make."""
+
+
+def encode_cursor(*values):
+    """Pack the sort key of the last row on a page into an opaque cursor."""
+    return urlsafe_b64encode('|'.join(str(value) for value in values).encode()).decode()
+
+
+def decode_cursor(cursor, *parsers):
+    """
+    Unpack a cursor made by encode_cursor(), turning each value back into
+    its type with the matching parser, e.g. ``date.fromisoformat``.
+
+    Raises InvalidCursor for anything else: cursors come from the query
+    string, so they may have been truncated or edited.
+    """
+    try:
+        values = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        if len(values) != len(parsers):
+            raise ValueError(f'expected {len(parsers)} values, got {len(values)}')
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}') from e
+
+
+def adjust_attendance_summary(course_id, semester_id, changes):
+    """
+    Apply status transitions to the AttendanceSummary counters of one course
+    and semester.
+
+    ``changes`` is an iterable of (student_id, old_status, new_status) tuples,
+    where ``None`` stands for "no row" (a create or a delete). Students whose
+    counters move by the same amounts share one UPDATE, so a roll-call costs a
+    handful of statements however many students it covers.
+    """
+    deltas = defaultdict(Counter)
+    for student_id, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        if old_status:
+            deltas[student_id][AttendanceSummary.STATUS_FIELDS[old_status]] -= 1
+        if new_status:
+            deltas[student_id][AttendanceSummary.STATUS_FIELDS[new_status]] += 1
+
+    groups = defaultdict(list)
+    for student_id, delta in deltas.items():
+        key = tuple(sorted((field, amount) for field, amount in delta.items() if amount))
+        if key:
+            groups[key].append(student_id)
+    if not groups:
+        return
+
+    # Only increments need a row to exist; a decrement always follows an
+    # earlier increment of the same row.
+    AttendanceSummary.objects.bulk_create([
+        AttendanceSummary(student_id=student_id, course_id=course_id, semester_id=semester_id)
+        for key, student_ids in groups.items()
+        if any(amount > 0 for field, amount in key)
+        for student_id in student_ids
+    ], ignore_conflicts=True)
+
+    now = timezone.now()
+    for key, student_ids in groups.items():
+        AttendanceSummary.objects.filter(
+            course_id=course_id,
+            semester_id=semester_id,
+            student_id__in=student_ids,
+        ).update(updated_at=now, **{field: Greatest(F(field) + amount, 0) for field, amount in key})
+
+
+def upsert_attendance(class_schedule, date, statuses, marked_by=None):
+    """
+    Record a roll-call for one class on one date.
+
+    ``statuses`` maps student primary keys to status codes. Existing rows for
+    those students are read in one query. All rows are then written with a
+    single INSERT ... ON CONFLICT DO UPDATE where the backend supports it,
+    or with bulk_create plus bulk_update otherwise. This all happens inside a
+    single transaction that also writes the AttendanceLog entries and the
+    AttendanceSummary counters, and that first locks the class schedule
+    where the backend has row locks. Returns the (created, updated) lists of
+    Attendance objects.
+    """
+    if not statuses:
+        return [], []
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # Two roll calls for the same class could otherwise both find a
+            # student's row missing and both insert it. The loser's ON
+            # CONFLICT update keeps the winner's id, so its CREATE log would
+            # point at a row that was never inserted and its summary change
+            # would count the student twice. Locking the class schedule
+            # makes them take turns. SQLite needs no lock: its transactions
+            # start IMMEDIATE, so one roll call writes at a time.
+            list(ClassSchedule.objects.select_for_update().filter(pk=class_schedule.pk).values_list('pk'))
+        existing = {
+            attendance.student_id: attendance
+            for attendance in Attendance.objects.filter(
+                class_schedule=class_schedule,
+                date=date,
+                student_id__in=list(statuses),
+            ).only('id', 'student_id', 'status', 'marked_by')
+        }
+
+        to_create = []
+        to_update = []
+        logs = []
+        changes = []
+        for student_id, status in statuses.items():
+            attendance = existing.get(student_id)
+            if attendance is None:
+                attendance = Attendance(
+                    student_id=student_id,
+                    class_schedule=class_schedule,
+                    date=date,
+                    status=status,
+                    marked_by=marked_by,
+                )
+                to_create.append(attendance)
+                logs.append(AttendanceLog(
+                    attendance=attendance, action='CREATE', new_status=status, changed_by=marked_by
+                ))
+                changes.append((student_id, None, status))
+            else:
+                if attendance.status != status:
+                    logs.append(AttendanceLog(
+                        attendance=attendance, action='UPDATE', old_status=attendance.status,
+                        new_status=status, changed_by=marked_by
+                    ))
+                    changes.append((student_id, attendance.status, status))
+                attendance.status = status
+                attendance.marked_by = marked_by
+                to_update.append(attendance)
+
+        if connection.features.supports_update_conflicts_with_target:
+            # One INSERT ... ON CONFLICT DO UPDATE for the whole roll call.
+            # Rows that already exist keep their primary key, so updates are
+            # sent as fresh instances matched on the unique columns.
+            Attendance.objects.bulk_create(
+                to_create + [
+                    Attendance(
+                        student_id=attendance.student_id,
+                        class_schedule=class_schedule,
+                        date=date,
+                        status=attendance.status,
+                        marked_by=marked_by,
+                    )
+                    for attendance in to_update
+                ],
+                update_conflicts=True,
+                unique_fields=['student', 'class_schedule', 'date'],
+                update_fields=['status', 'marked_by'],
+            )
+        else:
+            if to_create:
+                Attendance.objects.bulk_create(to_create)
+            if to_update:
+                Attendance.objects.bulk_update(to_update, ['status', 'marked_by'])
+        if logs:
+            AttendanceLog.objects.bulk_create(logs)
+        adjust_attendance_summary(class_schedule.course_id, class_schedule.semester_id, changes)
+        invalidate_dashboard_stats(date)
+        bump_versions(*attendance_scopes(
+            class_schedule.id, date, [student_id for student_id, old_status, new_status in changes]
+        ))
+
+    return to_create, to_update
+
+
+def count_attendance_summary():
+    """
+    Recount the AttendanceSummary counters from the Attendance table.
+
+    Returns a dict keyed by (student_id, course_id, semester_id) whose values
+    are dicts of counter field name to count.
+    """
+    rows = Attendance.objects.values(
+        'student_id', 'class_schedule__course_id', 'class_schedule__semester_id'
+    ).annotate(**{
+        field: Count('id', filter=Q(status=status))
+        for status, field in AttendanceSummary.STATUS_FIELDS.items()
+    }).order_by()
+
+    return {
+        (row['student_id'], row['class_schedule__course_id'], row['class_schedule__semester_id']): {
+            field: row[field] for field in AttendanceSummary.STATUS_FIELDS.values()
+        }
+        for row in rows
+    }
+
+
+def rebuild_attendance_summary(batch_size=1000):
+    """Replace every AttendanceSummary row with a fresh recount."""
+    counts = count_attendance_summary()
+    with transaction.atomic():
+        AttendanceSummary.objects.all().delete()
+        AttendanceSummary.objects.bulk_create([
+            AttendanceSummary(student_id=student_id, course_id=course_id, semester_id=semester_id, **counters)
+            for (student_id, course_id, semester_id), counters in counts.items()
+        ], batch_size=batch_size)
+    return len(counts)
+
+
+def backfill_enrollments(class_schedules=None):
+    """
+    Enroll every active student of a course's department in each of its class
+    schedules, which is how rosters were derived before Enrollment existed.
+    Existing enrollments are left alone. Returns the number of (student, class
+    schedule) pairs processed.
+    """
+    if class_schedules is None:
+        class_schedules = ClassSchedule.objects.all()
+    count = 0
+    with transaction.atomic():
+        for class_schedule_id, department_id in class_schedules.values_list('id', 'course__department_id'):
+            student_ids = Student.objects.filter(
+                department_id=department_id, is_active=True
+            ).values_list('id', flat=True)
+            count += len(Enrollment.objects.bulk_create([
+                Enrollment(student_id=student_id, class_schedule_id=class_schedule_id)
+                for student_id in student_ids
+            ], batch_size=1000, ignore_conflicts=True))
+        bump_versions('enrollments')
+    return count
+
+
+@cached_queryset('courses', 'departments')
+def active_courses():
+    """Active courses with their departments, served from the two-tier cache."""
+    return Course.objects.filter(is_active=True).select_related('department')
+
+
+@cached_queryset('students', 'student-users')
+def student_choices():
+    """(id, label) pairs for every active student, labelled like Student.__str__."""
+    students = Student.objects.filter(is_active=True).values_list(
+        'id', 'student_id', 'user__first_name', 'user__last_name'
+    )
+    return [
+        (pk, f"{student_id} - {f'{first_name} {last_name}'.strip()}")
+        for pk, student_id, first_name, last_name in students
+    ]
+
+
+@cached_queryset('class-schedules', 'courses')
+def class_schedule_choices():
+    """
+    (id, label) pairs for every active class schedule, labelled like
+    ClassSchedule.__str__ but with the start time as HH:MM.
+    """
+    days = dict(ClassSchedule.DAY_CHOICES)
+    schedules = ClassSchedule.objects.filter(is_active=True).values_list(
+        'id', 'course__code', 'day_of_week', 'start_time'
+    )
+    return [
+        (pk, f"{course_code} - {days.get(day_of_week, day_of_week)} {start_time:%H:%M}")
+        for pk, course_code, day_of_week, start_time in schedules
+    ]
+
+
+@cached_queryset('departments')
+def department_choices():
+    """(id, name) pairs for every department."""
+    return Department.objects.values_list('id', 'name')
+
+
+class StudentAttendanceStats:
+    """
+    Attendance counters for one student across every course.
+
+    All status buckets come from one aggregate over the student's
+    AttendanceSummary rows. The result is memoized in the cache under the
+    student's attendance version token, so any attendance write for the
+    student makes the next read recompute it.
+    """
+    timeout = 300
+
+    def __init__(self, student):
+        self.student_id = getattr(student, 'pk', student)
+
+    @use_primary
+    def get(self):
+        version, = get_versions(f'attendance-student:{self.student_id}')
+        key = f'student-stats:{self.student_id}:{version}'
+        stats = shared_get(key)
+        if stats is None:
+            stats = self.compute()
+            cache.set(key, stats, self.timeout)
+        return stats
+
+    def compute(self):
+        stats = AttendanceSummary.objects.filter(student_id=self.student_id).aggregate(**{
+            field: Coalesce(Sum(field), 0) for field in AttendanceSummary.STATUS_FIELDS.values()
+        })
+        stats['total'] = total = sum(stats.values())
+        stats['percentage'] = round((stats['present'] / total * 100) if total > 0 else 0, 1)
+        return stats
+
+
+EXPORT_COLUMNS = [
+    ('date', 'date'),
+    ('student_id', 'student__student_id'),
+    ('first_name', 'student__user__first_name'),
+    ('last_name', 'student__user__last_name'),
+    ('course', 'class_schedule__course__code'),
+    ('semester', 'class_schedule__semester__code'),
+    ('department', 'class_schedule__course__department__code'),
+    ('status', 'status'),
+    ('notes', 'notes'),
+]
+
+
+def filter_attendance_export(semester=None, course=None, department=None, start_date=None, end_date=None):
+    """Return the Attendance queryset covered by an export."""
+    attendances = Attendance.objects.all()
+    if semester:
+        attendances = attendances.filter(class_schedule__semester=semester)
+    if course:
+        attendances = attendances.filter(class_schedule__course=course)
+    if department:
+        attendances = attendances.filter(class_schedule__course__department=department)
+    if start_date:
+        attendances = attendances.filter(date__gte=start_date)
+    if end_date:
+        attendances = attendances.filter(date__lte=end_date)
+    return attendances
+
+
+class _Echo:
+    """File-like object whose write() hands the value back, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def stream_attendance_export(attendances, export_format='csv', chunk_size=2000):
+    """
+    Yield an export of ``attendances`` line by line as CSV or NDJSON.
+
+    Rows are read with a server-side iterator so memory stays flat whatever
+    the size of the export.
+    """
+    headers = [name for name, lookup in EXPORT_COLUMNS]
+    rows = attendances.order_by('date', 'id').values_list(
+        *[lookup for name, lookup in EXPORT_COLUMNS]
+    ).iterator(chunk_size=chunk_size)
+
+    if export_format == 'ndjson':
+        for row in rows:
+            yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + '\n'
+        return
+
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def attendance_scopes(class_schedule_id, date, student_ids):
+    """Version scopes touched by writing attendance for these students."""
+    return [
+        'attendance',
+        f'attendance:{class_schedule_id}:{date}',
+        *[f'attendance-student:{student_id}' for student_id in student_ids],
+    ]
+
+
+DASHBOARD_STATS_TIMEOUT = 60
+CLASS_COMPLETION_TIMEOUT = 30
+
+
+def _dashboard_stats_key(day):
+    return f'dashboard-stats:{day}'
+
+
+def _class_completion_key(day):
+    return f'class-completion:{day}'
+
+
+def invalidate_dashboard_stats(*days):
+    """Drop the cached dashboard stats and class completion for the given dates once the write commits."""
+    keys = [key for day in days for key in (_dashboard_stats_key(day), _class_completion_key(day))]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class ScalarCount(Subquery):
+    """
+    The row count of ``queryset`` as a scalar subquery.
+
+    aggregate() only takes expressions that contain an aggregate. The
+    subquery is uncorrelated, so it is just as valid next to them in the
+    SELECT list, and it is flagged as one.
+    """
+    contains_aggregate = True
+    output_field = IntegerField()
+
+    def __init__(self, queryset):
+        super().__init__(queryset.order_by().annotate(count=Func(F('pk'), function='COUNT')).values('count'))
+
+
+@use_primary
+def dashboard_stats(day=None):
+    """
+    Return the stats bundle shown on the staff dashboard for ``day``.
+
+    The active student, course and teacher counts and every status bucket for
+    the day come from a single aggregate query. The bundle is cached for
+    DASHBOARD_STATS_TIMEOUT seconds, and dropped whenever attendance for that
+    day is written or a student, course or teacher changes. ``generated_at``
+    records when it was computed, for use as a Last-Modified value.
+    """
+    day = day or timezone.now().date()
+    key = _dashboard_stats_key(day)
+    versions = get_versions('students', 'courses', 'teachers')
+    cached = shared_get(key)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    stats = Attendance.objects.filter(date=day).aggregate(
+        total_students=ScalarCount(Student.objects.filter(is_active=True)),
+        total_courses=ScalarCount(Course.objects.filter(is_active=True)),
+        total_teachers=ScalarCount(Teacher.objects.filter(is_active=True)),
+        attendance_today=Count('id'),
+        present_today=Count('id', filter=Q(status='P')),
+        absent_today=Count('id', filter=Q(status='A')),
+        late_today=Count('id', filter=Q(status='L')),
+        excused_today=Count('id', filter=Q(status='E')),
+    )
+    total_students = stats['total_students']
+    stats['attendance_rate'] = round(
+        (stats['present_today'] / total_students * 100) if total_students > 0 else 0, 2
+    )
+    stats['generated_at'] = timezone.now().replace(microsecond=0)
+    cache.set(key, (versions, stats), DASHBOARD_STATS_TIMEOUT)
+    return stats
+
+
+@use_primary
+def class_completion(day=None):
+    """
+    Return how far attendance has been taken for each class held on ``day``.
+
+    The classes come from one query and the marked counts from a second,
+    grouped by class schedule; roster sizes come from the roster index. The
+    result is cached for CLASS_COMPLETION_TIMEOUT seconds and dropped whenever
+    attendance for that day is written.
+    """
+    day = day or timezone.now().date()
+    key = _class_completion_key(day)
+    class_data = shared_get(key)
+    if class_data is None:
+        schedules = list(ClassSchedule.objects.filter(
+            day_of_week=day.isoweekday(),
+            is_active=True
+        ).select_related('course', 'teacher__user'))
+        marked = dict(
+            Attendance.objects.filter(
+                class_schedule__in=schedules, date=day
+            ).order_by().values('class_schedule_id').annotate(marked=Count('id')).values_list('class_schedule_id', 'marked')
+        ) if schedules else {}
+
+        class_data = []
+        for class_schedule in schedules:
+            total_students = len(roster_index.schedule_student_ids(class_schedule.id))
+            marked_attendance = marked.get(class_schedule.id, 0)
+            class_data.append({
+                'schedule': class_schedule,
+                'total_students': total_students,
+                'marked_attendance': marked_attendance,
+                'completion_percentage': round(
+                    (marked_attendance / total_students * 100) if total_students > 0 else 0, 1
+                ),
+            })
+        cache.set(key, class_data, CLASS_COMPLETION_TIMEOUT)
+    return class_data
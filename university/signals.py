@@ -0,0 +1,122 @@
+from operator import attrgetter
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_versions
+from .models import Attendance, AttendanceLog, ClassSchedule, Course, Department, Enrollment, Student, Teacher
+from .roster import bump_roster_version
+from .services import adjust_attendance_summary, attendance_scopes, invalidate_dashboard_stats
+
+
+def _schedule_keys(instance, class_schedule_id):
+    """Return the (course_id, semester_id) pair of a class schedule."""
+    if instance.class_schedule_id == class_schedule_id and Attendance.class_schedule.is_cached(instance):
+        return instance.class_schedule.course_id, instance.class_schedule.semester_id
+    return ClassSchedule.objects.values_list('course_id', 'semester_id').get(id=class_schedule_id)
+
+
+@receiver(pre_save, sender=Attendance)
+def remember_previous_attendance(sender, instance, raw=False, **kwargs):
+    instance._previous_attendance = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_attendance = Attendance.objects.filter(pk=instance.pk).values(
+        'student_id', 'class_schedule_id', 'date', 'status'
+    ).first()
+
+
+@receiver(post_save, sender=Attendance)
+def update_summary_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_attendance', None)
+    invalidate_dashboard_stats(instance.date, *([previous['date']] if previous else []))
+    bump_versions(*attendance_scopes(instance.class_schedule_id, instance.date, [instance.student_id]))
+    if previous:
+        bump_versions(*attendance_scopes(previous['class_schedule_id'], previous['date'], [previous['student_id']]))
+    current_keys = _schedule_keys(instance, instance.class_schedule_id)
+    
+    if previous is None:
+        adjust_attendance_summary(*current_keys, [(instance.student_id, None, instance.status)])
+        AttendanceLog.objects.create(
+            attendance=instance, action='CREATE', new_status=instance.status, changed_by=instance.marked_by
+        )
+        return
+    
+    previous_keys = _schedule_keys(instance, previous['class_schedule_id'])
+    if previous_keys == current_keys and previous['student_id'] == instance.student_id:
+        adjust_attendance_summary(*current_keys, [(instance.student_id, previous['status'], instance.status)])
+    else:
+        adjust_attendance_summary(*previous_keys, [(previous['student_id'], previous['status'], None)])
+        adjust_attendance_summary(*current_keys, [(instance.student_id, None, instance.status)])
+    
+    if previous['status'] != instance.status:
+        AttendanceLog.objects.create(
+            attendance=instance, action='UPDATE', old_status=previous['status'],
+            new_status=instance.status, changed_by=instance.marked_by
+        )
+
+
+@receiver(post_delete, sender=Attendance)
+def update_summary_on_delete(sender, instance, **kwargs):
+    invalidate_dashboard_stats(instance.date)
+    bump_versions(*attendance_scopes(instance.class_schedule_id, instance.date, [instance.student_id]))
+    adjust_attendance_summary(
+        *_schedule_keys(instance, instance.class_schedule_id),
+        [(instance.student_id, instance.status, None)]
+    )
+
+
+
+VERSION_SCOPES = {
+    Course: 'courses',
+    Department: 'departments',
+    Teacher: 'teachers',
+}
+# Scopes the roster index applies row by row: model -> (scope, row to note)
+ROSTER_SCOPES = {
+    Student: ('students', attrgetter('pk')),
+    ClassSchedule: ('class-schedules', attrgetter('pk')),
+    Enrollment: ('enrollments', attrgetter('student_id')),
+}
+
+
+@receiver(pre_save, sender=Enrollment)
+def remember_previous_enrollment(sender, instance, raw=False, **kwargs):
+    # Moving an enrollment to another student changes both their rosters
+    instance._previous_student_id = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_student_id = Enrollment.objects.filter(pk=instance.pk).values_list(
+        'student_id', flat=True
+    ).first()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_model_version(sender, instance, **kwargs):
+    if sender in ROSTER_SCOPES:
+        scope, row = ROSTER_SCOPES[sender]
+        bump_roster_version(scope, row(instance))
+        previous_student_id = getattr(instance, '_previous_student_id', None)
+        if previous_student_id is not None and previous_student_id != instance.student_id:
+            bump_roster_version(scope, previous_student_id)
+        return
+    scope = VERSION_SCOPES.get(sender)
+    if scope:
+        bump_versions(scope)
+
+
+@receiver(post_save, sender=User)
+def bump_versions_on_user_save(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Logins only touch last_login, which nothing shows, and a new user has no student or teacher yet
+    if raw or created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    student_id, teacher_id = User.objects.filter(pk=instance.pk).values_list('student', 'teacher').get()
+    if student_id is not None:
+        bump_roster_version('student-users', student_id)
+    if teacher_id is not None:
+        # Teachers are shown by their user's name
+        bump_versions('teachers')
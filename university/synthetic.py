@@ -0,0 +1,157 @@
+"""
+Synthetic university data for benchmarks and query budget tests.
+
+``seed_synthetic_university`` builds departments, teachers, courses, class
+schedules, students, enrollments and a semester of attendance with
+bulk_create in a single transaction. The semester ends in the current
+week, so "today" views have data to show. The same arguments and ``seed``
+always produce the same data.
+"""
+import random
+import uuid
+from datetime import time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_versions
+from .models import Attendance, ClassSchedule, Course, Department, Enrollment, Semester, Student, Teacher
+from .services import invalidate_dashboard_stats, rebuild_attendance_summary
+
+STATUS_WEIGHTS = {'P': 80, 'A': 10, 'L': 7, 'E': 3}
+VERSION_SCOPES = [
+    'students', 'student-users', 'departments', 'courses', 'teachers', 'class-schedules', 'enrollments',
+    'attendance',
+]
+
+
+def seed_synthetic_university(
+    students=1000,
+    departments=10,
+    courses_per_department=10,
+    teachers_per_department=5,
+    schedules_per_course=1,
+    courses_per_student=5,
+    weeks=15,
+    prefix='SYN',
+    seed=0,
+    batch_size=5000,
+):
+    """
+    Create a synthetic university and return the number of rows per model.
+
+    ``prefix`` (at most 5 characters) starts every code and username, so a
+    seeded dataset can sit alongside real data. Each student is enrolled in
+    ``courses_per_student`` class schedules of their own department. There
+    is one attendance row per enrollment for every meeting in the last
+    ``weeks`` weeks, up to today.
+    """
+    rng = random.Random(seed)
+    today = timezone.now().date()
+    first_monday = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+    # Every synthetic user shares one unusable password, so nothing is hashed per user
+    password = make_password(None)
+
+    with transaction.atomic():
+        semester = Semester.objects.create(
+            name=f'{prefix} Semester', code=f'{prefix}SEM', is_current=True,
+            start_date=first_monday, end_date=first_monday + timedelta(weeks=weeks, days=-1),
+        )
+        department_objs = Department.objects.bulk_create([
+            Department(name=f'{prefix} Department {i}', code=f'{prefix}D{i}') for i in range(departments)
+        ])
+
+        teacher_users = User.objects.bulk_create([
+            User(username=f'{prefix.lower()}-teacher-{department.code}-{i}', password=password,
+                 first_name='Teacher', last_name=f'{department.code}-{i}')
+            for department in department_objs for i in range(teachers_per_department)
+        ], batch_size=batch_size)
+        teacher_objs = Teacher.objects.bulk_create([
+            Teacher(user=user, teacher_id=f'{prefix}T{i:05}',
+                    department=department_objs[i // teachers_per_department], phone='555-0100')
+            for i, user in enumerate(teacher_users)
+        ], batch_size=batch_size)
+
+        course_objs = Course.objects.bulk_create([
+            Course(name=f'{department.name} Course {i}', code=f'{prefix}{d}C{i}', department=department, credits=3)
+            for d, department in enumerate(department_objs) for i in range(courses_per_department)
+        ], batch_size=batch_size)
+        schedule_objs = ClassSchedule.objects.bulk_create([
+            ClassSchedule(
+                course=course,
+                teacher=teacher_objs[
+                    c // courses_per_department * teachers_per_department + rng.randrange(teachers_per_department)
+                ],
+                semester=semester,
+                day_of_week=rng.randint(1, 5),
+                start_time=time(hour),
+                end_time=time(hour + 1),
+                room=f'R{rng.randint(100, 499)}',
+            )
+            for c, course in enumerate(course_objs) for hour in rng.sample(range(8, 18), schedules_per_course)
+        ], batch_size=batch_size)
+        schedules_by_department = {}
+        for class_schedule in schedule_objs:
+            schedules_by_department.setdefault(class_schedule.course.department_id, []).append(class_schedule)
+
+        student_users = User.objects.bulk_create([
+            User(username=f'{prefix.lower()}-student-{i}', password=password,
+                 first_name='Student', last_name=str(i), email=f'{prefix.lower()}-student-{i}@example.edu')
+            for i in range(students)
+        ], batch_size=batch_size)
+        student_objs = Student.objects.bulk_create([
+            Student(user=user, student_id=f'{prefix}{i:07}', department=rng.choice(department_objs),
+                    enrollment_date=first_monday, phone='555-0101')
+            for i, user in enumerate(student_users)
+        ], batch_size=batch_size)
+
+        enrollments = []
+        for student in student_objs:
+            options = schedules_by_department[student.department_id]
+            for class_schedule in rng.sample(options, min(courses_per_student, len(options))):
+                enrollments.append(Enrollment(student=student, class_schedule=class_schedule))
+        Enrollment.objects.bulk_create(enrollments, batch_size=batch_size)
+
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+        meeting_days = set()
+        attendance_count = 0
+        batch = []
+        for enrollment in enrollments:
+            class_schedule = enrollment.class_schedule
+            for week in range(weeks):
+                day = first_monday + timedelta(weeks=week, days=class_schedule.day_of_week - 1)
+                if day > today:
+                    break
+                meeting_days.add(day)
+                batch.append(Attendance(
+                    id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                    student_id=enrollment.student_id,
+                    class_schedule=class_schedule,
+                    date=day,
+                    status=rng.choices(statuses, weights)[0],
+                ))
+            if len(batch) >= batch_size:
+                Attendance.objects.bulk_create(batch)
+                attendance_count += len(batch)
+                batch = []
+        Attendance.objects.bulk_create(batch)
+        attendance_count += len(batch)
+
+        # bulk_create skips the signals that keep these up to date
+        summaries = rebuild_attendance_summary(batch_size=batch_size)
+        invalidate_dashboard_stats(*meeting_days)
+        bump_versions(*VERSION_SCOPES)
+
+    return {
+        'departments': len(department_objs),
+        'teachers': len(teacher_objs),
+        'courses': len(course_objs),
+        'class_schedules': len(schedule_objs),
+        'students': len(student_objs),
+        'enrollments': len(enrollments),
+        'attendance': attendance_count,
+        'attendance_summaries': summaries,
+    }
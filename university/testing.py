@@ -0,0 +1,67 @@
+"""
+Query and latency budgets for view tests.
+
+``BudgetTestCase.assertBudget`` fails when the block inside it runs more
+queries or takes longer than allowed. The failure message lists the
+statements that ran, grouped by shape with literals stripped, so an N+1
+shows up as one statement repeated once per row. Set the
+LATENCY_BUDGET_SCALE environment variable to loosen every latency ceiling
+at once on slow machines.
+"""
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b|\bNULL\b'), '?'),
+    (re.compile(r'"s\d+_x\d+"'), '"s?"'),
+    (re.compile(r'\((?:\?, )+\?\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:, \(\.\.\.\))+'), '(...), ...'),
+]
+# Statements listed in order are cut to this many characters
+MAX_STATEMENT = 300
+
+
+def normalize_sql(sql):
+    for pattern, replacement in LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def format_query_report(label, queries, budget):
+    shapes = Counter(normalize_sql(query['sql']) for query in queries)
+    lines = [f'{label} ran {len(queries)} queries, budget {budget}:']
+    for sql, count in shapes.most_common():
+        marker = '+' if count > 1 else ' '
+        lines.append(f'{marker} {count:>4}x {sql}')
+    lines.append('')
+    lines.append('In order:')
+    for number, query in enumerate(queries, 1):
+        sql = query['sql']
+        if len(sql) > MAX_STATEMENT:
+            sql = sql[:MAX_STATEMENT] + '...'
+        lines.append(f'  {number:>4}. {sql}')
+    return '\n'.join(lines)
+
+
+class BudgetTestCase(TestCase):
+    latency_scale = float(os.environ.get('LATENCY_BUDGET_SCALE', 1))
+
+    @contextmanager
+    def assertBudget(self, label, queries, ms):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            yield
+            elapsed = (time.perf_counter() - started) * 1000
+        if len(context.captured_queries) > queries:
+            self.fail(format_query_report(label, context.captured_queries, queries))
+        ceiling = ms * self.latency_scale
+        if elapsed > ceiling:
+            self.fail(f'{label} took {elapsed:.0f} ms, ceiling {ceiling:.0f} ms')
@@ -1,3 +1,1193 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time as clock
+from collections import Counter
+from datetime import date, time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import urls as university_urls
+from .cache import LocalLRUCache, local_cache
+from .instrumentation import RequestMetrics
+from . import cache as cache_module, checks, profiling, views
+from .metrics import ATTENDANCE_ROWS_WRITTEN, REQUESTS_IN_PROGRESS, MmapValueStore, render_metrics
+from .models import Attendance, AttendanceLog, AttendanceSummary, ClassSchedule, Course, Department, Enrollment, Semester, Student, Teacher
+from .roster import roster_index
+from .routers import PIN_COOKIE, REPLICA_DB_ALIAS, ReplicaRoutingMiddleware, use_primary
+from .synthetic import seed_synthetic_university
+from .testing import BudgetTestCase
+from .services import (
+    EXPORT_COLUMNS, InvalidCursor, StudentAttendanceStats, backfill_enrollments, class_completion,
+    class_schedule_choices, count_attendance_summary, dashboard_stats, decode_cursor, department_choices,
+    encode_cursor, upsert_attendance,
+)
+from .views import get_students_for_attendance
+
+
+class GetStudentsForAttendanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Computer Science', code='CS')
+        course = Course.objects.create(name='Algorithms', code='CS101', department=department, credits=3)
+        teacher = Teacher.objects.create(
+            user=User.objects.create(username='teacher', first_name='Ada', last_name='Lovelace'),
+            teacher_id='T001', department=department, phone='555-0100'
+        )
+        semester = Semester.objects.create(
+            name='Fall 2025', code='F25', start_date=date(2025, 9, 1), end_date=date(2025, 12, 20)
+        )
+        cls.class_schedule = ClassSchedule.objects.create(
+            course=course, teacher=teacher, semester=semester,
+            day_of_week=1, start_time=time(9), end_time=time(10)
+        )
+        users = User.objects.bulk_create([
+            User(username=f'student{i}', first_name='Student', last_name=str(i)) for i in range(500)
+        ])
+        cls.students = Student.objects.bulk_create([
+            Student(user=user, student_id=f'S{i:04}', department=department,
+                    enrollment_date=date(2025, 9, 1), phone='555-0101')
+            for i, user in enumerate(users)
+        ])
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, class_schedule=cls.class_schedule) for student in cls.students
+        ])
+        Attendance.objects.create(
+            student=cls.students[0], class_schedule=cls.class_schedule, date=date(2025, 10, 6), status='L'
+        )
+        cls.staff = User.objects.create(username='staff', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        roster_index.clear()
+
+    def get(self):
+        request = RequestFactory().get('/api/students-for-attendance/', {
+            'class_schedule_id': self.class_schedule.id,
+            'date': '2025-10-06',
+        })
+        request.user = self.staff
+        return async_to_sync(get_students_for_attendance)(request)
+
+    def test_cold_roster_uses_constant_queries(self):
+        # The class schedule and the day's attendance, plus two queries that
+        # load the roster index: students, then class schedules with their
+        # enrollments. However many students are enrolled, and only once per
+        # process; a warm roster is the first two alone
+        with self.assertNumQueries(4):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+
+    def test_warm_roster_uses_constant_queries(self):
+        self.get()
+        # The roster itself comes from the warm roster index
+        with self.assertNumQueries(2):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+
+    def rename(self, student, first_name):
+        student.user.first_name = first_name
+        with self.captureOnCommitCallbacks(execute=True):
+            student.user.save()
+
+    def test_editing_a_students_user_reloads_only_their_record(self):
+        # The index has to know the count of edits it is up to date with
+        self.rename(self.students[4], 'Counted')
+        self.get()
+        self.rename(self.students[3], 'Renamed')
+
+        # The two queries of a warm roster, plus the one edited student
+        with self.assertNumQueries(3):
+            response = self.get()
+        students = {row['id']: row for row in json.loads(response.content)['students']}
+        self.assertEqual(students[self.students[3].id]['name'], 'Renamed 3')
+
+    def test_missed_user_edits_reload_every_record(self):
+        self.rename(self.students[4], 'Counted')
+        self.get()
+        self.rename(self.students[3], 'Renamed')
+        # As if the record of the edit had been evicted from the cache
+        cache.delete(f"change:student-users:{cache.get('version:student-users')}")
+
+        # The two queries of a warm roster, plus every student
+        with self.assertNumQueries(3):
+            response = self.get()
+        students = {row['id']: row for row in json.loads(response.content)['students']}
+        self.assertEqual(students[self.students[3].id]['name'], 'Renamed 3')
+
+    def test_editing_other_users_keeps_the_roster(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.staff.save()
+        with self.assertNumQueries(2):
+            self.get()
+
+    def roster_ids(self):
+        return {row['id'] for row in json.loads(self.get().content)['students']}
+
+    def write(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+    def count_roster_changes(self):
+        # The index has to know the count of changes it is up to date with
+        self.write(self.students[4].save)
+        self.write(self.class_schedule.save)
+        self.write(Enrollment.objects.get(student=self.students[4]).save)
+        self.get()
+
+    def test_roster_writes_reload_only_the_rows_written(self):
+        self.count_roster_changes()
+        deactivated, unenrolled = self.students[5], self.students[6]
+        deactivated.is_active = False
+        enrollment = Enrollment.objects.get(student=unenrolled)
+        for label, change, missing in [
+            ('student', deactivated.save, {deactivated.id}),
+            ('enrollment deleted', enrollment.delete, {deactivated.id, unenrolled.id}),
+            ('enrollment added', lambda: Enrollment.objects.create(
+                student=unenrolled, class_schedule=self.class_schedule
+            ), {deactivated.id}),
+            ('class schedule', self.class_schedule.save, {deactivated.id}),
+        ]:
+            with self.subTest(label):
+                self.write(change)
+                # The two queries of a warm roster, plus the rows written
+                with self.assertNumQueries(3):
+                    student_ids = self.roster_ids()
+                self.assertEqual({student.id for student in self.students} - student_ids, missing)
+
+    def test_bulk_roster_writes_reload_every_row(self):
+        removed, unenrolled = self.students[7], self.students[6]
+        self.write(Enrollment.objects.get(student=removed).delete)
+        self.count_roster_changes()
+        self.assertNotIn(removed.id, self.roster_ids())
+
+        # Bulk writes bump the version without recording their rows, so the
+        # single write after them cannot be applied on its own
+        self.write(backfill_enrollments)
+        self.write(Enrollment.objects.get(student=unenrolled).delete)
+
+        student_ids = self.roster_ids()
+        self.assertIn(removed.id, student_ids)
+        self.assertNotIn(unenrolled.id, student_ids)
+
+    def test_conditional_get_revalidates_after_related_renames(self):
+        class_schedule = ClassSchedule.objects.select_related('course__department', 'teacher__user').get(
+            pk=self.class_schedule.pk
+        )
+        url = reverse('students_for_attendance')
+        params = {'class_schedule_id': class_schedule.id, 'date': '2025-10-06'}
+        self.client.force_login(self.staff)
+        for label, instance, field in [
+            ('course', class_schedule.course, 'name'),
+            ('department', class_schedule.course.department, 'name'),
+            ('teacher', class_schedule.teacher.user, 'first_name'),
+        ]:
+            with self.subTest(label):
+                etag = self.client.get(url, params)['ETag']
+                self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+                setattr(instance, field, f'Renamed {label}')
+                with self.captureOnCommitCallbacks(execute=True):
+                    instance.save()
+
+                response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(f'Renamed {label}', response.content.decode())
+
+    def test_class_schedule_labels_show_hours_and_minutes(self):
+        local_cache.clear()
+        self.assertIn((self.class_schedule.id, 'CS101 - Monday 09:00'), class_schedule_choices())
+
+    def test_existing_status_is_reported(self):
+        students = {row['id']: row for row in json.loads(self.get().content)['students']}
+        self.assertEqual(len(students), 500)
+        self.assertEqual(students[self.students[0].id]['existing_status'], 'L')
+        self.assertIsNone(students[self.students[1].id]['existing_status'])
+        self.assertEqual(students[self.students[1].id]['department'], 'Computer Science')
+
+
+class ViewBudgetTests(BudgetTestCase):
+    """
+    Query and latency budgets for every URL in university/urls.py, measured
+    with empty caches against a synthetic university.
+
+    Query budgets do not depend on the dataset size, so per-row queries such
+    as a lazy ``student.user`` in a loop blow through them.
+    """
+    # url name: (user, queries, ms)
+    BUDGETS = {
+        'home': ('staff', 2, 100),
+        'dashboard': ('staff', 4, 200),
+        'take_attendance': ('staff', 4, 300),
+        'bulk_attendance': ('staff', 12, 500),
+        'attendance_list': ('staff', 4, 300),
+        'attendance_report': ('staff', 7, 500),
+        'export_attendance': ('staff', 3, 500),
+        'student_management': ('staff', 3, 500),
+        'course_management': ('staff', 3, 300),
+        'add_course': ('staff', 6, 300),
+        'students_by_class': ('staff', 4, 300),
+        'students_for_attendance': ('staff', 6, 300),
+        'mark_attendance_api': ('staff', 11, 200),
+        'attendance_stats': ('student', 4, 200),
+        'metrics': ('staff', 2, 100),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=300, departments=3, courses_per_department=3, teachers_per_department=2,
+            courses_per_student=3, weeks=2,
+        )
+        cls.staff = User.objects.create(username='budget-staff', is_staff=True, is_superuser=True)
+        cls.class_schedule = ClassSchedule.objects.order_by('id').first()
+        cls.roster = list(
+            Enrollment.objects.filter(class_schedule=cls.class_schedule).values_list('student_id', flat=True)
+        )
+        cls.student = Student.objects.select_related('user').get(pk=cls.roster[0])
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        roster_index.clear()
+
+    def request(self, name):
+        """(method, path, data, extra) for one request to the URL called ``name``."""
+        today = timezone.now().date().isoformat()
+        class_schedule = self.class_schedule
+        if name == 'bulk_attendance':
+            return 'post', reverse(name), {
+                'class_schedule': class_schedule.id,
+                'date': today,
+                **{f'student_{student_id}': 'P' for student_id in self.roster},
+            }, {}
+        if name == 'add_course':
+            # There is no add_course.html template yet, so only the POST is measured
+            return 'post', reverse(name), {
+                'name': 'Budget Course', 'code': 'BUDGET1', 'department': class_schedule.course.department_id,
+                'credits': 3, 'is_active': True,
+            }, {}
+        if name == 'attendance_report':
+            return 'get', reverse(name), {'course_id': class_schedule.course_id}, {}
+        if name == 'students_by_class':
+            return 'get', reverse(name, args=[class_schedule.id]), None, {}
+        if name == 'students_for_attendance':
+            return 'get', reverse(name), {'class_schedule_id': class_schedule.id, 'date': today}, {}
+        if name == 'mark_attendance_api':
+            return 'post', reverse(name), json.dumps({
+                'student_id': self.student.id,
+                'class_schedule_id': class_schedule.id,
+                'status': 'L',
+                'date': today,
+            }), {'content_type': 'application/json'}
+        return 'get', reverse(name), None, {}
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in university_urls.urlpatterns}
+        self.assertEqual(names - set(self.BUDGETS), set(), 'URLs without a query budget')
+
+    def test_views_stay_within_budget(self):
+        for name, (user, queries, ms) in self.BUDGETS.items():
+            with self.subTest(name):
+                cache.clear()
+                local_cache.clear()
+                roster_index.clear()
+                self.client.force_login(self.staff if user == 'staff' else self.student.user)
+                method, path, data, extra = self.request(name)
+                with self.assertBudget(f'{method.upper()} {path}', queries, ms):
+                    response = getattr(self.client, method)(path, data, **extra)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400, f'{name} returned {response.status_code}')
+
+
+class AttendanceSummaryTests(TestCase):
+    """AttendanceSummary and AttendanceLog follow every way attendance is written."""
+
+    DATE = date(2024, 1, 15)
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=20, departments=1, courses_per_department=2, teachers_per_department=1,
+            courses_per_student=2, weeks=2,
+        )
+        cls.staff = User.objects.create(username='summary-staff', is_staff=True)
+        cls.class_schedule, cls.other_class_schedule = ClassSchedule.objects.order_by('id')[:2]
+        cls.roster = list(
+            Enrollment.objects.filter(class_schedule=cls.class_schedule).values_list('student_id', flat=True)
+        )
+
+    def assertSummaryMatchesAttendance(self):
+        stored = {
+            (summary.student_id, summary.course_id, summary.semester_id): {
+                field: getattr(summary, field) for field in AttendanceSummary.STATUS_FIELDS.values()
+            }
+            for summary in AttendanceSummary.objects.all()
+        }
+        # Counters that fell back to zero leave their row behind
+        stored = {key: counters for key, counters in stored.items() if any(counters.values())}
+        self.assertEqual(stored, count_attendance_summary())
+
+    def logs(self, attendance):
+        return list(AttendanceLog.objects.filter(attendance=attendance).order_by('id').values_list(
+            'action', 'old_status', 'new_status', 'changed_by'
+        ))
+
+    def create(self, status='P'):
+        return Attendance.objects.create(
+            student_id=self.roster[0], class_schedule=self.class_schedule, date=self.DATE, status=status,
+            marked_by=self.staff,
+        )
+
+    def test_seeded_summary_matches(self):
+        self.assertSummaryMatchesAttendance()
+
+    def test_create(self):
+        attendance = self.create()
+        self.assertSummaryMatchesAttendance()
+        self.assertEqual(self.logs(attendance), [('CREATE', '', 'P', self.staff.id)])
+
+    def test_status_change(self):
+        attendance = self.create()
+        attendance.status = 'L'
+        attendance.save()
+        self.assertSummaryMatchesAttendance()
+        self.assertEqual(self.logs(attendance), [
+            ('CREATE', '', 'P', self.staff.id),
+            ('UPDATE', 'P', 'L', self.staff.id),
+        ])
+
+    def test_move_to_another_class_schedule(self):
+        attendance = self.create()
+        attendance.class_schedule = self.other_class_schedule
+        attendance.save()
+        self.assertSummaryMatchesAttendance()
+        # The status did not change, so there is nothing new to log
+        self.assertEqual(self.logs(attendance), [('CREATE', '', 'P', self.staff.id)])
+
+    def test_move_and_status_change(self):
+        attendance = self.create()
+        attendance.class_schedule = self.other_class_schedule
+        attendance.status = 'E'
+        attendance.save()
+        self.assertSummaryMatchesAttendance()
+        self.assertEqual(self.logs(attendance)[-1], ('UPDATE', 'P', 'E', self.staff.id))
+
+    def test_delete(self):
+        attendance = self.create()
+        attendance.delete()
+        self.assertSummaryMatchesAttendance()
+        self.assertFalse(AttendanceLog.objects.filter(attendance_id=attendance.id).exists())
+
+    def test_bulk_mark_and_re_mark(self):
+        upsert_attendance(
+            self.class_schedule, self.DATE, {student_id: 'P' for student_id in self.roster}, marked_by=self.staff
+        )
+        self.assertSummaryMatchesAttendance()
+        self.assertEqual(
+            AttendanceLog.objects.filter(attendance__date=self.DATE, action='CREATE', new_status='P').count(),
+            len(self.roster),
+        )
+
+        changed = self.roster[:3]
+        upsert_attendance(
+            self.class_schedule, self.DATE,
+            {student_id: 'A' if student_id in changed else 'P' for student_id in self.roster},
+            marked_by=self.staff,
+        )
+        self.assertSummaryMatchesAttendance()
+        updates = AttendanceLog.objects.filter(attendance__date=self.DATE, action='UPDATE')
+        self.assertEqual(
+            sorted(updates.values_list('attendance__student_id', 'old_status', 'new_status')),
+            sorted((student_id, 'P', 'A') for student_id in changed),
+        )
+
+
+    def test_student_stats_follow_every_write(self):
+        student_id = self.roster[0]
+
+        def recount():
+            counts = Counter(Attendance.objects.filter(student_id=student_id).values_list('status', flat=True))
+            stats = {field: counts[status] for status, field in AttendanceSummary.STATUS_FIELDS.items()}
+            stats['total'] = total = sum(stats.values())
+            stats['percentage'] = round(stats['present'] / total * 100 if total else 0, 1)
+            return stats
+
+        def write(change):
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            # Read through the cache, which each write has to invalidate
+            self.assertEqual(StudentAttendanceStats(student_id).get(), recount())
+
+        cache.clear()
+        StudentAttendanceStats(student_id).get()
+        write(lambda: upsert_attendance(self.class_schedule, self.DATE, {student_id: 'P'}, self.staff))
+        write(lambda: upsert_attendance(self.other_class_schedule, self.DATE, {student_id: 'A'}, self.staff))
+        attendance = Attendance.objects.get(student_id=student_id, class_schedule=self.class_schedule, date=self.DATE)
+        attendance.status = 'L'
+        write(attendance.save)
+        write(lambda: upsert_attendance(self.other_class_schedule, self.DATE, {student_id: 'E'}, self.staff))
+        write(attendance.delete)
+        write(Attendance.objects.filter(student_id=student_id).delete)
+
+class UpsertAttendanceTests(TestCase):
+    DATE = date(2024, 1, 15)
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=30, departments=1, courses_per_department=1, teachers_per_department=1,
+            courses_per_student=1, weeks=1,
+        )
+        cls.staff = User.objects.create(username='upsert-staff', is_staff=True)
+        cls.other_staff = User.objects.create(username='upsert-other-staff', is_staff=True)
+        cls.class_schedule = ClassSchedule.objects.order_by('id').first()
+        cls.roster = list(
+            Enrollment.objects.filter(class_schedule=cls.class_schedule).values_list('student_id', flat=True)
+        )
+
+    def test_new_rows_are_created(self):
+        created, updated = upsert_attendance(self.class_schedule, self.DATE, {self.roster[0]: 'P'}, self.staff)
+        self.assertEqual(updated, [])
+        self.assertEqual([attendance.student_id for attendance in created], [self.roster[0]])
+        self.assertEqual(Attendance.objects.get(date=self.DATE).id, created[0].id)
+
+    def test_existing_rows_are_updated(self):
+        upsert_attendance(self.class_schedule, self.DATE, {self.roster[0]: 'P'}, self.staff)
+        created, updated = upsert_attendance(
+            self.class_schedule, self.DATE, {self.roster[0]: 'L', self.roster[1]: 'A'}, self.staff
+        )
+        self.assertEqual([attendance.student_id for attendance in created], [self.roster[1]])
+        self.assertEqual([attendance.student_id for attendance in updated], [self.roster[0]])
+        self.assertEqual(
+            dict(Attendance.objects.filter(date=self.DATE).values_list('student_id', 'status')),
+            {self.roster[0]: 'L', self.roster[1]: 'A'},
+        )
+        self.assertEqual(Attendance.objects.filter(date=self.DATE).count(), 2)
+
+    def test_re_marking_updates_marked_by(self):
+        statuses = {student_id: 'P' for student_id in self.roster}
+        upsert_attendance(self.class_schedule, self.DATE, statuses, self.staff)
+        created, updated = upsert_attendance(self.class_schedule, self.DATE, statuses, self.other_staff)
+        self.assertEqual((len(created), len(updated)), (0, len(self.roster)))
+        self.assertEqual(
+            set(Attendance.objects.filter(date=self.DATE).values_list('marked_by', flat=True)),
+            {self.other_staff.id},
+        )
+        # Only status changes are logged
+        self.assertFalse(AttendanceLog.objects.filter(attendance__date=self.DATE, action='UPDATE').exists())
+
+    def test_query_count_does_not_grow_with_the_roster(self):
+        counts = []
+        for day, student_ids in [(15, self.roster[:2]), (16, self.roster)]:
+            with CaptureQueriesContext(connection) as queries:
+                upsert_attendance(
+                    self.class_schedule, date(2024, 1, day), {student_id: 'P' for student_id in student_ids},
+                    self.staff,
+                )
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+    def test_take_attendance_rejects_unknown_statuses(self):
+        self.client.force_login(self.staff)
+        for status in ['X', '']:
+            with self.subTest(status=status):
+                response = self.client.post(reverse('take_attendance'), {
+                    'student': self.roster[0], 'class_schedule': self.class_schedule.id,
+                    'date': self.DATE.isoformat(), 'status': status,
+                })
+                self.assertContains(response, f'Invalid status: {status}')
+                self.assertFalse(Attendance.objects.filter(date=self.DATE).exists())
+
+@skipUnless(connection.vendor == 'sqlite', 'copies the replica with the sqlite3 backup API')
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Routing against a replica that is a separate SQLite file, copied from
+    the primary in setUp. Rows written afterwards exist only on the
+    primary, so every read shows which database answered it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Added here rather than in settings, so the test runner neither
+        # creates a test database for the replica nor routes other tests to it
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        cls.replica_path = os.path.join(cls.replica_dir.name, 'replica.sqlite3')
+        connections.settings[REPLICA_DB_ALIAS] = {
+            **connections['default'].settings_dict, 'NAME': cls.replica_path,
+        }
+        cls.databases = {'default', REPLICA_DB_ALIAS}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA_DB_ALIAS].close()
+        del connections[REPLICA_DB_ALIAS]
+        del connections.settings[REPLICA_DB_ALIAS]
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        Department.objects.create(name='Replicated', code='OLD')
+        self.replicate()
+        Department.objects.create(name='Not yet replicated', code='NEW')
+
+    def replicate(self):
+        connections[REPLICA_DB_ALIAS].close()
+        connections['default'].ensure_connection()
+        with sqlite3.connect(self.replica_path) as replica:
+            connections['default'].connection.backup(replica)
+        replica.close()
+
+    def department_codes(self):
+        return ','.join(Department.objects.order_by('code').values_list('code', flat=True))
+
+    def serve(self, request, view):
+        return ReplicaRoutingMiddleware(view)(request)
+
+    def read_view(self, request):
+        return HttpResponse(self.department_codes())
+
+    def test_get_reads_from_the_replica(self):
+        response = self.serve(RequestFactory().get('/'), self.read_view)
+        self.assertEqual(response.content, b'OLD')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_post_reads_from_the_primary(self):
+        response = self.serve(RequestFactory().post('/'), self.read_view)
+        self.assertEqual(response.content, b'NEW,OLD')
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertEqual(self.department_codes(), 'NEW,OLD')
+
+    def test_write_pins_later_reads_to_the_primary(self):
+        def view(request):
+            before = self.department_codes()
+            Department.objects.create(name='Written', code='WRITE')
+            return HttpResponse(f'{before}|{self.department_codes()}')
+
+        response = self.serve(RequestFactory().get('/'), view)
+        self.assertEqual(response.content, b'OLD|NEW,OLD,WRITE')
+        self.assertEqual(response.cookies[PIN_COOKIE].value, '1')
+
+    def test_pin_cookie_keeps_the_next_request_on_the_primary(self):
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        response = self.serve(request, self.read_view)
+        self.assertEqual(response.content, b'NEW,OLD')
+
+    def test_use_primary_decorator(self):
+        response = self.serve(RequestFactory().get('/'), use_primary(self.read_view))
+        self.assertEqual(response.content, b'NEW,OLD')
+
+    def test_use_primary_block(self):
+        def view(request):
+            with use_primary():
+                inside = self.department_codes()
+            return HttpResponse(f'{inside}|{self.department_codes()}')
+
+        response = self.serve(RequestFactory().get('/'), view)
+        self.assertEqual(response.content, b'NEW,OLD|OLD')
+
+    def test_reads_inside_atomic_use_the_primary(self):
+        def view(request):
+            with transaction.atomic():
+                inside = self.department_codes()
+            return HttpResponse(f'{inside}|{self.department_codes()}')
+
+        response = self.serve(RequestFactory().get('/'), view)
+        self.assertEqual(response.content, b'NEW,OLD|OLD')
+
+
+class DashboardStatsTests(TestCase):
+    DATE = date(2024, 1, 15)
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=20, departments=1, courses_per_department=1, teachers_per_department=2,
+            courses_per_student=1, weeks=1,
+        )
+        cls.staff = User.objects.create(username='dashboard-staff', is_staff=True)
+        cls.class_schedule = ClassSchedule.objects.order_by('id').first()
+        cls.roster = list(
+            Enrollment.objects.filter(class_schedule=cls.class_schedule).values_list('student_id', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def test_stats_are_counted_in_one_query(self):
+        upsert_attendance(self.class_schedule, self.DATE, {
+            self.roster[0]: 'P', self.roster[1]: 'P', self.roster[2]: 'A', self.roster[3]: 'E',
+        }, self.staff)
+        with self.assertNumQueries(1):
+            stats = dashboard_stats(self.DATE)
+        self.assertEqual({key: value for key, value in stats.items() if key != 'generated_at'}, {
+            'total_students': 20, 'total_courses': 1, 'total_teachers': 2,
+            'attendance_today': 4, 'present_today': 2, 'absent_today': 1, 'late_today': 0, 'excused_today': 1,
+            'attendance_rate': 10.0,
+        })
+
+    def test_student_changes_refresh_the_stats(self):
+        self.assertEqual(dashboard_stats(self.DATE)['total_students'], 20)
+        student = Student.objects.get(pk=self.roster[0])
+        student.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            student.save()
+        self.assertEqual(dashboard_stats(self.DATE)['total_students'], 19)
+
+
+    def completion(self, day):
+        return {
+            row['schedule'].id: (row['total_students'], row['marked_attendance'], row['completion_percentage'])
+            for row in class_completion(day)
+        }
+
+    def test_class_completion_is_cached_until_attendance_is_written(self):
+        roster_index.clear()
+        # A day the class meets on: 2024-01-15 is a Monday
+        day = date(2024, 1, 14 + self.class_schedule.day_of_week)
+        self.assertEqual(self.completion(day)[self.class_schedule.id], (20, 0, 0))
+
+        # Cached for CLASS_COMPLETION_TIMEOUT seconds, here 30
+        with self.assertNumQueries(0):
+            self.completion(day)
+        now = clock.time()
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=now + 29):
+            with self.assertNumQueries(0):
+                self.completion(day)
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=now + 31):
+            with self.assertNumQueries(2):
+                self.completion(day)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_attendance(
+                self.class_schedule, day, {student_id: 'P' for student_id in self.roster[:5]}, self.staff
+            )
+        self.assertEqual(self.completion(day)[self.class_schedule.id], (20, 5, 25.0))
+
+class AttendanceReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=3, departments=1, courses_per_department=1, teachers_per_department=1,
+            schedules_per_course=2, courses_per_student=2, weeks=1,
+        )
+        Attendance.objects.all().delete()
+        cls.staff = User.objects.create(username='report-staff', is_staff=True)
+        cls.course = Course.objects.get()
+        cls.class_schedule, cls.other_class_schedule = ClassSchedule.objects.order_by('id')
+        cls.students = list(Student.objects.order_by('student_id'))
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        roster_index.clear()
+
+    def test_percentages_count_every_class_of_the_course(self):
+        first, second, third = [student.id for student in self.students]
+        upsert_attendance(self.class_schedule, date(2024, 1, 15), {first: 'P', second: 'A', third: 'L'}, self.staff)
+        upsert_attendance(self.class_schedule, date(2024, 1, 22), {first: 'P', second: 'P'}, self.staff)
+        upsert_attendance(self.other_class_schedule, date(2024, 1, 16), {first: 'A', second: 'E'}, self.staff)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('attendance_report'), {'course_id': self.course.id})
+        self.assertEqual([
+            (row['student'].id, row['total_classes'], row['present_classes'], row['percentage'])
+            for row in response.context['attendance_data']
+        ], [(first, 3, 2, 66.67), (second, 3, 1, 33.33), (third, 1, 0, 0.0)])
+
+
+class AttendanceExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=2, departments=1, courses_per_department=1, teachers_per_department=1,
+            courses_per_student=1, weeks=1,
+        )
+        Attendance.objects.all().delete()
+        cls.staff = User.objects.create(username='export-staff', is_staff=True)
+        class_schedule = ClassSchedule.objects.select_related('course__department', 'semester').get()
+        first, second = Student.objects.select_related('user').order_by('student_id')
+        upsert_attendance(class_schedule, date(2024, 1, 15), {first.id: 'P', second.id: 'A'}, cls.staff)
+        Attendance.objects.filter(student=second).update(notes='Sick, "flu"')
+        codes = [
+            class_schedule.course.code, class_schedule.semester.code, class_schedule.course.department.code,
+        ]
+        cls.rows = [
+            ['2024-01-15', first.student_id, first.user.first_name, first.user.last_name, *codes, 'P', ''],
+            ['2024-01-15', second.student_id, second.user.first_name, second.user.last_name, *codes, 'A', 'Sick, "flu"'],
+        ]
+
+    def export(self, **params):
+        self.client.force_login(self.staff)
+        return self.client.get(reverse('export_attendance'), params)
+
+    def test_csv_export(self):
+        response = self.export(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="attendance.csv"')
+        header, *rows = csv.reader(b''.join(response.streaming_content).decode().splitlines())
+        self.assertEqual(
+            header, ['date', 'student_id', 'first_name', 'last_name', 'course', 'semester', 'department', 'status', 'notes']
+        )
+        # Rows of a day are ordered by their random uuid
+        self.assertEqual(sorted(rows), self.rows)
+
+    def test_ndjson_export(self):
+        response = self.export(format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="attendance.ndjson"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(sorted(list(json.loads(line).values()) for line in lines), self.rows)
+        self.assertEqual(list(json.loads(lines[0])), [name for name, lookup in EXPORT_COLUMNS])
+
+    def test_csv_is_the_default_format(self):
+        self.assertEqual(self.export()['Content-Type'], 'text/csv')
+
+    def test_unknown_format_is_rejected(self):
+        response = self.export(format='xlsx')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('format', response.json()['error'])
+
+
+class AttendanceListTests(TestCase):
+    # Garbage, bad base64, bytes that are not UTF-8, too few values, a value that is not a date
+    INVALID_CURSORS = ['not a cursor', 'YQ', '__4=', encode_cursor('2024-01-15', '09:00:00'),
+                       encode_cursor('yesterday', '09:00:00', '0' * 32)]
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=30, departments=1, courses_per_department=2, teachers_per_department=1,
+            courses_per_student=2, weeks=1,
+        )
+        cls.staff = User.objects.create(username='list-staff', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_decode_cursor_raises_one_error_type(self):
+        for cursor in self.INVALID_CURSORS:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor, date.fromisoformat, time.fromisoformat, str)
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor(date(2024, 1, 15), time(9), 'abc')
+        self.assertEqual(decode_cursor(cursor, date.fromisoformat, time.fromisoformat, str),
+                         [date(2024, 1, 15), time(9), 'abc'])
+
+    def test_invalid_cursor_shows_the_first_page(self):
+        first_page = self.client.get(reverse('attendance_list'))
+        for cursor in self.INVALID_CURSORS:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('attendance_list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['attendances']), list(first_page.context['attendances']))
+
+    def test_next_page_follows_the_first(self):
+        first_page = self.client.get(reverse('attendance_list'))
+        second_page = self.client.get(f"{reverse('attendance_list')}?{first_page.context['next_query']}")
+        self.assertEqual(second_page.status_code, 200)
+        self.assertTrue(second_page.context['attendances'])
+        self.assertFalse(set(first_page.context['attendances']) & set(second_page.context['attendances']))
+
+
+class MarkAttendanceConcurrencyTests(TransactionTestCase):
+    """
+    Under WSGI each request thread runs the async mark_attendance_api on an
+    event loop of its own, so whatever limits concurrent writes has to work
+    across loops.
+    """
+
+    def setUp(self):
+        seed_synthetic_university(
+            students=10, departments=1, courses_per_department=1, teachers_per_department=1,
+            courses_per_student=1, weeks=1,
+        )
+        self.staff = User.objects.create(username='concurrency-staff', is_staff=True)
+        self.enrollments = list(Enrollment.objects.order_by('id')[:3])
+
+    def test_concurrent_writes_from_threads(self):
+        def slow_upsert(*args, **kwargs):
+            # Keeps each write holding its slot while the others queue
+            clock.sleep(0.05)
+            return upsert_attendance(*args, **kwargs)
+
+        clients = []
+        for enrollment in self.enrollments:
+            client = Client()
+            client.force_login(self.staff)
+            clients.append((client, enrollment))
+        responses = []
+
+        def mark(client, enrollment):
+            responses.append(client.post(reverse('mark_attendance_api'), json.dumps({
+                'student_id': enrollment.student_id,
+                'class_schedule_id': enrollment.class_schedule_id,
+                'status': 'P',
+                'date': '2024-01-15',
+            }), content_type='application/json'))
+
+        with mock.patch.object(views, 'upsert_attendance', side_effect=slow_upsert):
+            threads = [threading.Thread(target=mark, args=pair, daemon=True) for pair in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+
+        self.assertFalse(any(thread.is_alive() for thread in threads), 'a write never got a slot')
+        self.assertEqual([response.status_code for response in responses], [200] * 3,
+                         [response.json() for response in responses])
+        self.assertEqual(Attendance.objects.filter(date='2024-01-15').count(), 3)
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+class RequestMetricsMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=20, departments=1, courses_per_department=2, teachers_per_department=1,
+            courses_per_student=2, weeks=1,
+        )
+        cls.staff = User.objects.create(username='metrics-staff', is_staff=True, is_superuser=True)
+        cls.class_schedule = ClassSchedule.objects.order_by('id').first()
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        roster_index.clear()
+        self.client.force_login(self.staff)
+        self.async_client.force_login(self.staff)
+
+    def logged_fields(self, logs):
+        self.assertEqual(len(logs.records), 1)
+        return json.loads(logs.records[0].getMessage())
+
+    def test_sampled_request_is_timed_and_logged(self):
+        with self.assertLogs('university.requests', 'INFO') as logs:
+            response = self.client.get(reverse('dashboard'))
+
+        fields = self.logged_fields(logs)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(fields['view'], 'dashboard')
+        self.assertEqual(fields['status'], 200)
+        self.assertGreater(fields['db_queries'], 0)
+        self.assertIsNotNone(fields['db_slowest_sql'])
+        self.assertGreater(fields['template_ms'], 0)
+        self.assertEqual(fields['response_bytes'], len(response.content))
+        self.assertIn(f'db;dur={fields["db_ms"]};desc="{fields["db_queries"]} queries"', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+
+    @override_settings(REQUEST_METRICS_LOG_LEVEL='debug')
+    def test_lines_are_logged_at_the_configured_level(self):
+        with self.assertLogs('university.requests', 'DEBUG') as logs:
+            self.client.get(reverse('dashboard'))
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'])
+
+    async def test_async_view_queries_are_counted(self):
+        with self.assertLogs('university.requests', 'INFO') as logs:
+            response = await self.async_client.get(
+                reverse('students_for_attendance'), {'class_schedule_id': self.class_schedule.id}
+            )
+
+        fields = self.logged_fields(logs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(fields['view'], 'students_for_attendance')
+        self.assertGreater(fields['db_queries'], 2)
+        self.assertIn('Server-Timing', response)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_request_is_left_alone(self):
+        with self.assertNoLogs('university.requests'):
+            response = self.client.get(reverse('dashboard'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_repeated_statements_are_counted(self):
+        student_ids = Student.objects.values_list('id', flat=True)[:3]
+        with RequestMetrics() as metrics:
+            for student_id in student_ids:
+                Student.objects.get(pk=student_id)
+
+        sql, count = metrics.most_repeated()
+        self.assertEqual(count, 3)
+        self.assertIn('university_student', sql)
+        self.assertEqual(metrics.queries, 4)
+
+
+# Far above any Linux pid_max, so never a live process
+DEAD_PID = 999999999
+
+
+def sample_value(text, sample):
+    match = re.search(rf'^{re.escape(sample)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=20, departments=1, courses_per_department=2, teachers_per_department=1,
+            courses_per_student=2, weeks=1,
+        )
+        cls.staff = User.objects.create(username='metrics-staff', is_staff=True, is_superuser=True)
+        cls.class_schedule = ClassSchedule.objects.order_by('id').first()
+        cls.roster = list(
+            Enrollment.objects.filter(class_schedule=cls.class_schedule).values_list('student_id', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        roster_index.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_attendance_writes_are_counted_per_path_and_status(self):
+        self.client.force_login(self.staff)
+        sample = 'attendance_rows_written_total{path="BulkAttendanceAPI",status="L"}'
+        before = sample_value(self.scrape(), sample)
+
+        response = self.client.post(reverse('api-bulk-attendance'), json.dumps({
+            'class_schedule_id': self.class_schedule.id,
+            'date': timezone.now().date().isoformat(),
+            'attendance_data': [{'student_id': student_id, 'status': 'L'} for student_id in self.roster],
+        }), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sample_value(self.scrape(), sample), before + len(self.roster))
+
+    def test_request_latency_histogram(self):
+        self.client.force_login(self.staff)
+        before = sample_value(self.scrape(), 'http_request_duration_seconds_count{view="dashboard"}')
+        self.client.get(reverse('dashboard'))
+
+        text = self.scrape()
+        count = sample_value(text, 'http_request_duration_seconds_count{view="dashboard"}')
+        self.assertEqual(count, before + 1)
+        self.assertEqual(sample_value(text, 'http_request_duration_seconds_bucket{view="dashboard",le="+Inf"}'), count)
+        self.assertIn('# TYPE http_request_db_queries histogram', text)
+        self.assertIn('cache_lookups_total{kind="dashboard-stats",result="miss"}', text)
+
+    def test_endpoint_needs_staff_or_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_process_files_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            for pid, rows in [(os.getpid(), 2), (DEAD_PID, 3)]:
+                MmapValueStore(os.path.join(directory, f'counter_{pid}.db')).add(
+                    ATTENDANCE_ROWS_WRITTEN._key({'path': 'take_attendance', 'status': 'P'}), rows
+                )
+                MmapValueStore(os.path.join(directory, f'gauge_{pid}.db')).add(REQUESTS_IN_PROGRESS._key({}), 4)
+
+            text = render_metrics()
+
+        # Counters of exited workers are kept, their gauges are not
+        self.assertEqual(sample_value(text, 'attendance_rows_written_total{path="take_attendance",status="P"}'), 5)
+        self.assertEqual(sample_value(text, 'http_requests_in_progress'), 4)
+        self.assertEqual(sample_value(text, 'worker_processes'), 1)
+
+    def test_mmap_store_grows_and_reopens(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'counter_1.db')
+            store = MmapValueStore(path)
+            for i in range(5000):
+                store.add(f'key-{i}', i)
+            store.add('key-1', 1)
+
+            values = dict(MmapValueStore(path).items())
+
+        self.assertEqual(len(values), 5000)
+        self.assertEqual(values['key-1'], 2)
+        self.assertEqual(values['key-4999'], 4999)
+
+
+class SlowRequestProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_university(
+            students=20, departments=1, courses_per_department=2, teachers_per_department=1,
+            courses_per_student=2, weeks=1,
+        )
+        cls.staff = User.objects.create(username='profile-staff', is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        roster_index.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = self.settings(SLOW_REQUEST_PROFILE_DIR=directory.name, SLOW_REQUEST_THRESHOLD_MS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.staff)
+
+    def test_sampler_records_the_running_stack(self):
+        def busy_roll_call():
+            deadline = clock.perf_counter() + 0.1
+            while clock.perf_counter() < deadline:
+                pass
+
+        sampler = profiling.StackSampler(0.001)
+        sampler.start(threading.get_ident())
+        busy_roll_call()
+        stacks = sampler.stop(threading.get_ident())
+
+        self.assertTrue(any('busy_roll_call' in stack.split(';')[-1] for stack in stacks))
+
+    def test_stopping_does_not_wait_for_a_sample(self):
+        folding = threading.Event()
+
+        def slow_fold(frame):
+            folding.set()
+            clock.sleep(0.5)
+            return 'slow'
+
+        sampler = profiling.StackSampler(0.001)
+        with mock.patch.object(profiling, 'fold', side_effect=slow_fold):
+            sampler.start(threading.get_ident())
+            self.assertTrue(folding.wait(timeout=5))
+            started = clock.perf_counter()
+            stacks = sampler.stop(threading.get_ident())
+            self.assertLess(clock.perf_counter() - started, 0.25)
+        # The sample being taken when the request ended is dropped
+        self.assertEqual(stacks, {})
+
+    def test_slow_request_is_kept_and_browsable(self):
+        self.client.get(reverse('dashboard'))
+
+        profile_id, = profiling.profile_ids()
+        profile = profiling.load_profile(profile_id)
+        self.assertEqual(profile['view'], 'dashboard')
+        self.assertGreater(profile['db_queries'], 0)
+
+        response = self.client.get(reverse('admin:university_requestprofile_changelist'))
+        self.assertContains(response, reverse('admin:university_requestprofile_change', args=[profile_id]))
+        response = self.client.get(reverse('admin:university_requestprofile_change', args=[profile_id]))
+        self.assertContains(response, 'Download folded stacks')
+        response = self.client.get(reverse('admin:university_requestprofile_folded', args=[profile_id]))
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        response = self.client.get(reverse('admin:university_requestprofile_change', args=['..']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_fast_request_is_discarded(self):
+        with self.settings(SLOW_REQUEST_THRESHOLD_MS=60000):
+            self.client.get(reverse('dashboard'))
+        self.assertEqual(profiling.profile_ids(), [])
+
+    def test_oldest_profiles_are_dropped(self):
+        with self.settings(SLOW_REQUEST_PROFILE_MAX=2):
+            ids = [profiling.save_profile({'path': f'/{i}'}, {'a;b': 1}) for i in range(3)]
+        self.assertEqual(profiling.profile_ids(), ids[:0:-1])
+        self.assertEqual(profiling.top_frames(profiling.load_folded(ids[2])), [('b', 1, 1), ('a', 0, 1)])
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def bump(self, scope, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            cache_module.bump_version_with_change(scope, change)
+        return int(cache_module.get_versions(scope)[0])
+
+    def test_lru_evicts_the_least_recently_used_entry(self):
+        lru = LocalLRUCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(lru.get('a'), 1)
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual((lru.get('a'), lru.get('c')), (1, 3))
+        # Overwriting a key does not grow the cache
+        lru.set('a', 4)
+        lru.set('c', 5)
+        self.assertEqual((lru.get('a'), lru.get('c')), (4, 5))
+
+    def test_lru_entries_expire(self):
+        lru = LocalLRUCache(timeout=30)
+        with mock.patch.object(cache_module.time, 'monotonic', return_value=1000):
+            lru.set('short', 1, timeout=10)
+            # Never kept longer than the cache's own timeout
+            lru.set('long', 2, timeout=600)
+        with mock.patch.object(cache_module.time, 'monotonic', return_value=1015):
+            self.assertIsNone(lru.get('short'))
+            self.assertEqual(lru.get('long'), 2)
+        with mock.patch.object(cache_module.time, 'monotonic', return_value=1030):
+            self.assertIsNone(lru.get('long'))
+
+    def test_cached_queryset_is_invalidated_by_a_version_bump(self):
+        local_cache.clear()
+        Department.objects.create(name='History', code='HIS')
+        with self.assertNumQueries(1):
+            self.assertEqual([name for pk, name in department_choices()], ['History'])
+        with self.assertNumQueries(0):
+            department_choices()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Department.objects.create(name='Physics', code='PHY')
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(name for pk, name in department_choices()), ['History', 'Physics'])
+
+    def test_change_history_is_bounded(self):
+        first = self.bump('test', 0)
+        for change in range(1, cache_module.CHANGE_HISTORY + 1):
+            last = self.bump('test', change)
+
+        self.assertIsNone(cache.get(f'change:test:{first}'))
+        self.assertEqual(
+            cache_module.changes_since('test', first, last), list(range(1, cache_module.CHANGE_HISTORY + 1))
+        )
+        self.assertIsNone(cache_module.changes_since('test', first - 1, last))
+
+    def test_version_tokens_expire(self):
+        with mock.patch.object(cache_module, 'VERSION_TIMEOUT', 0), self.captureOnCommitCallbacks(execute=True):
+            cache_module.bump_versions('attendance:1:2025-10-06')
+            cache_module.bump_version_with_change('test', 0)
+        self.assertIsNone(cache.get('version:attendance:1:2025-10-06'))
+        self.assertIsNone(cache.get('version:test'))
+        self.assertIsNone(cache.get(f"change:test:{cache.get('changes:test')}"))
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    REDIS = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+
+    def test_process_local_cache_warns_in_production(self):
+        with override_settings(DEBUG=False, CACHES=self.LOCMEM):
+            self.assertEqual([warning.id for warning in checks.check_shared_cache(None)], ['university.W001'])
+
+    def test_process_local_cache_is_fine_in_development(self):
+        with override_settings(DEBUG=True, CACHES=self.LOCMEM):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+    def test_shared_cache_passes(self):
+        with override_settings(DEBUG=False, CACHES=self.REDIS):
+            self.assertEqual(checks.check_shared_cache(None), [])
@@ -10,6 +10,7 @@ urlpatterns = [
     path('attendance/bulk/', views.bulk_attendance, name='bulk_attendance'),
     path('attendance/list/', views.attendance_list, name='attendance_list'),
     path('attendance/report/', views.attendance_report, name='attendance_report'),
+    path('attendance/export/', views.export_attendance, name='export_attendance'),
     
     # Management URLs
     path('students/', views.student_management, name='student_management'),
@@ -18,6 +19,10 @@ urlpatterns = [
     
     # API URLs
     path('api/students-by-class/<int:class_schedule_id>/', views.get_students_by_class, name='students_by_class'),
+    path('api/students-for-attendance/', views.get_students_for_attendance, name='students_for_attendance'),
     path('api/mark-attendance/', views.mark_attendance_api, name='mark_attendance_api'),
     path('api/attendance-stats/', views.get_attendance_stats, name='attendance_stats'),
+    
+    # Monitoring
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
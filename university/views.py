@@ -1,15 +1,45 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
-from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import F, Q, Sum
 from django.utils import timezone
-from datetime import date, timedelta
+from django.utils.crypto import constant_time_compare
+from datetime import date, time, timedelta
+from uuid import UUID
 import json
+import threading
 
-from .models import Attendance, Student, ClassSchedule, Course, Department, Teacher, Semester
-from .forms import AttendanceForm, BulkAttendanceForm, DateRangeForm, StudentSearchForm, CourseForm
+from .models import Attendance, AttendanceSummary, Student, ClassSchedule, Course, Teacher
+from .roster import roster_index
+from .routers import use_primary
+from .cache import versioned_etag
+from .decorators import login_required, staff_member_required
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, count_attendance_written, render_metrics
+from .forms import AttendanceExportForm, BulkAttendanceForm, DateRangeForm, CourseForm
+from .services import (
+    VALID_STATUSES, InvalidCursor, dashboard_stats, decode_cursor, encode_cursor, filter_attendance_export,
+    StudentAttendanceStats, active_courses, class_completion, class_schedule_choices,
+    stream_attendance_export, student_choices, upsert_attendance,
+)
+
+ATTENDANCE_PAGE_SIZE = 50
+# A thread semaphore rather than an asyncio one: under WSGI every request
+# thread runs async views on an event loop of its own, and an asyncio
+# semaphore can only be waited on from a single loop
+ATTENDANCE_WRITE_SLOTS = threading.BoundedSemaphore(settings.ASYNC_DB_WRITE_CONCURRENCY)
+
+def throttled_upsert_attendance(*args, **kwargs):
+    with ATTENDANCE_WRITE_SLOTS:
+        return upsert_attendance(*args, **kwargs)
+
+async def aget_object_or_404(model, **kwargs):
+    # django.shortcuts only gains an async version in Django 5.0
+    try:
+        return await model.objects.aget(**kwargs)
+    except model.DoesNotExist:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
 
 def home(request):
     if request.user.is_authenticated:
@@ -32,14 +62,7 @@ def dashboard(request):
     if hasattr(request.user, 'student'):
         student = request.user.student
         attendances = Attendance.objects.filter(student=student)
-        
-        total_classes = attendances.count()
-        present_classes = attendances.filter(status='P').count()
-        
-        if total_classes > 0:
-            attendance_percentage = (present_classes / total_classes) * 100
-        else:
-            attendance_percentage = 0
+        stats = StudentAttendanceStats(student).get()
         
         recent_attendances = attendances.select_related(
             'class_schedule__course', 'class_schedule__teacher__user'
@@ -47,15 +70,16 @@ def dashboard(request):
         
         context.update({
             'student': student,
-            'total_classes': total_classes,
-            'present_classes': present_classes,
-            'attendance_percentage': round(attendance_percentage, 1),
+            'total_classes': stats['total'],
+            'present_classes': stats['present'],
+            'attendance_percentage': stats['percentage'],
             'recent_attendances': recent_attendances,
         })
     
     elif request.user.is_staff:
-        total_students = Student.objects.filter(is_active=True).count()
-        total_attendance_today = Attendance.objects.filter(date=today).count()
+        stats = dashboard_stats(today)
+        total_students = stats['total_students']
+        total_attendance_today = stats['attendance_today']
         
         recent_attendance = Attendance.objects.select_related(
             'student', 'class_schedule__course'
@@ -79,6 +103,9 @@ def take_attendance(request):
             status = request.POST.get('status')
             notes = request.POST.get('notes', '')
             
+            if status not in VALID_STATUSES:
+                raise ValueError(f'Invalid status: {status}')
+            
             student = Student.objects.get(id=student_id)
             class_schedule = ClassSchedule.objects.get(id=class_schedule_id)
             
@@ -92,6 +119,7 @@ def take_attendance(request):
                     'marked_by': request.user
                 }
             )
+            count_attendance_written('take_attendance', [status])
             
             messages.success(request, f'Attendance marked for {student.user.get_full_name()}!')
             return redirect('take_attendance')
@@ -99,12 +127,9 @@ def take_attendance(request):
         except Exception as e:
             messages.error(request, f'Error: {str(e)}')
     
-    students = Student.objects.filter(is_active=True).select_related('user')
-    class_schedules = ClassSchedule.objects.filter(is_active=True).select_related('course')
-    
     return render(request, 'university/take_attendance.html', {
-        'students': students,
-        'class_schedules': class_schedules,
+        'students': student_choices(),
+        'class_schedules': class_schedule_choices(),
         'today': timezone.now().date()
     })
 
@@ -116,27 +141,15 @@ def bulk_attendance(request):
             class_schedule = form.cleaned_data['class_schedule']
             date = form.cleaned_data['date']
             
-            students = Student.objects.filter(
-                department=class_schedule.course.department,
-                is_active=True
-            )
+            statuses = {}
+            for student_id in roster_index.schedule_student_ids(class_schedule.id):
+                status = request.POST.get(f"student_{student_id}", 'A')
+                if status in VALID_STATUSES:
+                    statuses[student_id] = status
             
-            attendance_count = 0
-            for student in students:
-                status_key = f"student_{student.id}"
-                status = request.POST.get(status_key, 'A')
-                
-                if status in ['P', 'A', 'L', 'E']:
-                    Attendance.objects.update_or_create(
-                        student=student,
-                        class_schedule=class_schedule,
-                        date=date,
-                        defaults={
-                            'status': status,
-                            'marked_by': request.user
-                        }
-                    )
-                    attendance_count += 1
+            created, updated = upsert_attendance(class_schedule, date, statuses, marked_by=request.user)
+            count_attendance_written('bulk_attendance', statuses.values())
+            attendance_count = len(created) + len(updated)
             
             messages.success(request, f'Attendance recorded for {attendance_count} students!')
             return redirect('attendance_list')
@@ -167,39 +180,72 @@ def attendance_list(request):
         thirty_days_ago = timezone.now().date() - timedelta(days=30)
         attendances = attendances.filter(date__gte=thirty_days_ago)
     
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            after_date, after_time, after_id = decode_cursor(cursor, date.fromisoformat, time.fromisoformat, UUID)
+        except InvalidCursor:
+            # A mangled link: start again from the first page
+            cursor = None
+    if cursor:
+        attendances = attendances.filter(
+            Q(date__lt=after_date)
+            | Q(date=after_date, class_schedule__start_time__gt=after_time)
+            | Q(date=after_date, class_schedule__start_time=after_time, id__gt=after_id)
+        )
+    
     attendances = attendances.select_related(
         'student__user',
         'class_schedule__course',
         'class_schedule__teacher__user'
-    ).order_by('-date', 'class_schedule__start_time')
+    ).only(
+        'date', 'status',
+        'student__user__first_name', 'student__user__last_name',
+        'class_schedule__start_time', 'class_schedule__course__name',
+        'class_schedule__teacher__user__first_name', 'class_schedule__teacher__user__last_name',
+    ).order_by('-date', 'class_schedule__start_time', 'id')
+    
+    # Fetch one extra row to learn whether there is a next page without a COUNT
+    page = list(attendances[:ATTENDANCE_PAGE_SIZE + 1])
+    next_query = None
+    if len(page) > ATTENDANCE_PAGE_SIZE:
+        page = page[:ATTENDANCE_PAGE_SIZE]
+        last = page[-1]
+        query = request.GET.copy()
+        query['cursor'] = encode_cursor(last.date, last.class_schedule.start_time, last.id.hex)
+        next_query = query.urlencode()
+    
+    first_query = request.GET.copy()
+    first_query.pop('cursor', None)
     
     return render(request, 'university/attendance_list.html', {
-        'attendances': attendances,
-        'form': form
+        'attendances': page,
+        'form': form,
+        'next_query': next_query,
+        'first_query': first_query.urlencode() if cursor else None,
     })
 
 @staff_member_required
 def attendance_report(request):
-    courses = Course.objects.filter(is_active=True)
+    courses = active_courses()
     selected_course = None
     attendance_data = []
     
     course_id = request.GET.get('course_id')
     if course_id:
         selected_course = get_object_or_404(Course, id=course_id)
-        students = Student.objects.filter(
-            department=selected_course.department,
-            is_active=True
-        )
+        counts = {
+            row['student_id']: row
+            for row in AttendanceSummary.objects.filter(course=selected_course).values('student_id').annotate(
+                total_classes=Sum(F('present') + F('absent') + F('late') + F('excused')),
+                present_classes=Sum('present'),
+            ).order_by()
+        }
         
-        for student in students:
-            attendances = Attendance.objects.filter(
-                student=student,
-                class_schedule__course=selected_course
-            )
-            
-            total_classes = attendances.count()
-            present_classes = attendances.filter(status='P').count()
+        for student in roster_index.records(roster_index.course_student_ids(selected_course.id)):
+            row = counts.get(student.id, {})
+            total_classes = row.get('total_classes', 0)
+            present_classes = row.get('present_classes', 0)
             
             if total_classes > 0:
                 percentage = (present_classes / total_classes) * 100
@@ -219,6 +265,24 @@ def attendance_report(request):
         'attendance_data': attendance_data
     })
 
+@staff_member_required
+def export_attendance(request):
+    form = AttendanceExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'error': form.errors}, status=400)
+    
+    filters = form.cleaned_data
+    export_format = filters.pop('format') or 'csv'
+    attendances = filter_attendance_export(**filters)
+    
+    content_type = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    response = StreamingHttpResponse(
+        stream_attendance_export(attendances, export_format),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="attendance.{export_format}"'
+    return response
+
 # STUDENT MANAGEMENT
 @staff_member_required
 def student_management(request):
@@ -248,26 +312,38 @@ def add_course(request):
 
 # API VIEWS
 @staff_member_required
+@versioned_etag(lambda request, class_schedule_id: ['students', 'student-users', 'class-schedules', 'enrollments'])
 def get_students_by_class(request, class_schedule_id):
-    class_schedule = get_object_or_404(ClassSchedule, id=class_schedule_id)
-    students = Student.objects.filter(
-        department=class_schedule.course.department,
-        is_active=True
-    ).select_related('user')
+    if not roster_index.has_schedule(class_schedule_id):
+        raise Http404('Class schedule not found')
     
     student_data = []
-    for student in students:
+    for student in roster_index.records(roster_index.schedule_student_ids(class_schedule_id)):
         student_data.append({
             'id': student.id,
             'student_id': student.student_id,
-            'name': student.user.get_full_name(),
-            'email': student.user.email,
+            'name': student.name,
+            'email': student.email,
         })
     
     return JsonResponse({'students': student_data})
 
+def attendance_roster_scopes(request):
+    class_schedule_id = request.GET.get('class_schedule_id')
+    if not class_schedule_id:
+        return None
+    date = request.GET.get('date', timezone.now().date())
+    # The class info names the course and teacher, and each student their department
+    return [
+        'students', 'student-users', 'class-schedules', 'enrollments', 'courses', 'departments', 'teachers',
+        f'attendance:{class_schedule_id}:{date}',
+    ]
+
 @staff_member_required
-def get_students_for_attendance(request):
+@versioned_etag(attendance_roster_scopes)
+# Roll call must see check-ins from other devices as soon as they commit
+@use_primary
+async def get_students_for_attendance(request):
     class_schedule_id = request.GET.get('class_schedule_id')
     date = request.GET.get('date', timezone.now().date())
     
@@ -275,27 +351,30 @@ def get_students_for_attendance(request):
         return JsonResponse({'error': 'Class schedule ID required'}, status=400)
     
     try:
-        class_schedule = ClassSchedule.objects.get(id=class_schedule_id)
-        students = Student.objects.filter(
-            department=class_schedule.course.department,
-            is_active=True
-        ).select_related('user')
+        class_schedule = await ClassSchedule.objects.select_related(
+            'course', 'teacher__user'
+        ).aget(id=class_schedule_id)
+        students = await sync_to_async(roster_index.records)(
+            await sync_to_async(roster_index.schedule_student_ids)(class_schedule.id)
+        )
         
-        student_data = []
-        for student in students:
-            existing_attendance = Attendance.objects.filter(
-                student=student,
+        existing_statuses = {
+            student_id: status
+            async for student_id, status in Attendance.objects.filter(
                 class_schedule=class_schedule,
                 date=date
-            ).first()
-            
+            ).values_list('student_id', 'status')
+        }
+        
+        student_data = []
+        for student in students:
             student_data.append({
                 'id': student.id,
                 'student_id': student.student_id,
-                'name': student.user.get_full_name(),
-                'email': student.user.email,
-                'department': student.department.name,
-                'existing_status': existing_attendance.status if existing_attendance else None,
+                'name': student.name,
+                'email': student.email,
+                'department': roster_index.department_names.get(student.department_id),
+                'existing_status': existing_statuses.get(student.id),
             })
         
         return JsonResponse({
@@ -311,7 +390,7 @@ def get_students_for_attendance(request):
         return JsonResponse({'error': 'Class schedule not found'}, status=404)
 
 @login_required
-def mark_attendance_api(request):
+async def mark_attendance_api(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
@@ -320,19 +399,26 @@ def mark_attendance_api(request):
             status = data.get('status')
             date_str = data.get('date')
             
-            student = get_object_or_404(Student, id=student_id)
-            class_schedule = get_object_or_404(ClassSchedule, id=class_schedule_id)
+            student = await aget_object_or_404(Student, id=student_id)
+            class_schedule = await aget_object_or_404(ClassSchedule, id=class_schedule_id)
             date = timezone.datetime.strptime(date_str, '%Y-%m-%d').date()
             
-            attendance, created = Attendance.objects.update_or_create(
-                student=student,
-                class_schedule=class_schedule,
-                date=date,
-                defaults={
-                    'status': status,
-                    'marked_by': request.user
-                }
+            if status not in VALID_STATUSES:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': f'Invalid status: {status}'
+                }, status=400)
+            
+            # The write, its log rows and summary updates share one
+            # transaction, so they run together on one thread. Only a few
+            # run at once per process: the database takes one writer at a
+            # time anyway, and queued requests should wait for a slot
+            # rather than each hold a connection open on the write lock.
+            created, updated = await sync_to_async(throttled_upsert_attendance)(
+                class_schedule, date, {student.id: status}, marked_by=request.user
             )
+            count_attendance_written('mark_attendance_api', [status])
+            attendance = (created or updated)[0]
             
             return JsonResponse({
                 'status': 'success',
@@ -415,52 +501,40 @@ def student_qr_scan(request):
 
 @staff_member_required
 def mobile_attendance(request):
-    today_classes = ClassSchedule.objects.filter(
-        day_of_week=timezone.now().isoweekday(),
-        is_active=True
-    ).select_related('course', 'teacher__user')
-    
-    class_data = []
-    for class_schedule in today_classes:
-        total_students = Student.objects.filter(
-            department=class_schedule.course.department,
-            is_active=True
-        ).count()
-        
-        marked_attendance = Attendance.objects.filter(
-            class_schedule=class_schedule,
-            date=timezone.now().date()
-        ).count()
-        
-        class_data.append({
-            'schedule': class_schedule,
-            'total_students': total_students,
-            'marked_attendance': marked_attendance,
-            'completion_percentage': round((marked_attendance / total_students * 100) if total_students > 0 else 0, 1)
-        })
-    
     return render(request, 'university/mobile_attendance.html', {
-        'class_data': class_data,
+        'class_data': class_completion(),
         'today': timezone.now().date()
     })
 
-@login_required
-def get_attendance_stats(request):
+def attendance_stats_scopes(request):
     if hasattr(request.user, 'student'):
-        student = request.user.student
-        attendances = Attendance.objects.filter(student=student)
-        
-        total = attendances.count()
-        present = attendances.filter(status='P').count()
-        absent = attendances.filter(status='A').count()
-        late = attendances.filter(status='L').count()
+        return [f'attendance-student:{request.user.student.id}']
+    return None
+
+@login_required
+@versioned_etag(attendance_stats_scopes)
+async def get_attendance_stats(request):
+    student = await sync_to_async(getattr)(request.user, 'student', None)
+    if student is not None:
+        stats = await sync_to_async(StudentAttendanceStats(student).get)()
         
         return JsonResponse({
-            'total': total,
-            'present': present,
-            'absent': absent,
-            'late': late,
-            'percentage': round((present / total * 100) if total > 0 else 0, 1)
+            'total': stats['total'],
+            'present': stats['present'],
+            'absent': stats['absent'],
+            'late': stats['late'],
+            'percentage': stats['percentage']
         })
     
-    return JsonResponse({'error': 'Not a student'}, status=400)
\ No newline at end of file
+    return JsonResponse({'error': 'Not a student'}, status=400)
+
+def metrics(request):
+    # Scrapers send METRICS_TOKEN as a bearer token; without one configured,
+    # only staff can look
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)